@@ -1,3 +1,9 @@
-from .app import App
-
 __all__ = ["App"]
+
+
+def __getattr__(name):
+    # the GUI pulls in kivy, python -m app sync must work without it
+    if name == "App":
+        from .app import App
+        return App
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
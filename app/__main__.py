@@ -0,0 +1,57 @@
+import sys
+import json
+import argparse
+
+from contextlib import redirect_stdout
+
+from .config import APP_CONFIG_PATH, ConfigService, load_config
+from .engine import SyncEngine, GAME_TYPES
+from .metrics import Metrics
+
+
+def sync(args):
+
+    def on_done(job, exc):
+        if exc is None:
+            print("installed {}".format(job.skin_name), file=sys.stderr)
+        else:
+            print("failed {}: {}".format(job.skin_name, exc), file=sys.stderr)
+
+    # stdout carries only the summary, diagnostics go to stderr
+    with redirect_stdout(sys.stderr):
+        ConfigService().use(load_config(args.config))
+        engine = SyncEngine(jobs=args.jobs)
+        engine.http_client.ping()
+        try:
+            summary = engine.sync(leagues=args.league, game=args.game, force=args.force, on_done=on_done)
+        finally:
+            # short runs end before the periodic export
+            Metrics().export()
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app", description="Simrace content manager")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sync_parser = subparsers.add_parser("sync", help="download and install skins without the GUI")
+    sync_parser.add_argument("--league", action="append", help="league id, can be repeated (default: all leagues)")
+    sync_parser.add_argument("--game", choices=sorted(GAME_TYPES.values()), help="only skins of this game")
+    sync_parser.add_argument("--jobs", type=int, help="parallel downloads (default: generic/workers)")
+    sync_parser.add_argument("--force", action="store_true", help="reinstall skins that are up to date")
+    sync_parser.add_argument("--config", default=APP_CONFIG_PATH, help="settings file (default: the GUI settings)")
+    args = parser.parse_args(argv)
+
+    try:
+        summary = sync(args)
+    except Exception as exc:
+        json.dump({'error': str(exc)}, sys.stdout)
+        print()
+        return 2
+    json.dump(summary, sys.stdout, indent=2)
+    print()
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,347 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from zipfile import ZipFile
+
+from .metrics import Metrics, traced
+
+
+# folders of the ACC game directory that are backed up
+CUSTOMS_ROOTS = ('Customs/Cars', 'Customs/Liveries')
+
+
+class BackupCancelled(Exception):
+    pass
+
+
+# deduplicated snapshot store for the ACC Customs folders
+#
+# every file is stored once under objects/ named by the sha1 of its
+# content, each backup is a small snapshots/<id>.json manifest mapping
+# backed up paths to size, mtime and hash, so unchanged textures cost
+# nothing no matter how many snapshots refer to them. A file whose size
+# and mtime did not change since the last snapshot is neither read nor
+# stored again. Changed files are deflated in parallel (zlib releases
+# the GIL) and everything is written to temp files first, so a cancelled
+# or failed run leaves the previous snapshots untouched. Old snapshots
+# are dropped by the retention rules and unreferenced objects collected
+class BackupStore:
+
+    _CHUNK_SIZE = 1024 * 1024
+    _COMPRESS_LEVEL = 6
+    _COMPRESSED_SUFFIX = '.z'
+    _LEGACY_ARCHIVE = 'backup.zip'
+
+    def __init__(self, destination_path, keep_last=5, keep_daily=7, keep_weekly=4):
+        self.destination_path = destination_path
+        self.objects_path = os.path.join(destination_path, 'objects')
+        self.snapshots_path = os.path.join(destination_path, 'snapshots')
+        self.legacy_path = os.path.join(destination_path, self._LEGACY_ARCHIVE)
+        self.keep_last = keep_last
+        self.keep_daily = keep_daily
+        self.keep_weekly = keep_weekly
+
+    @property
+    def exists(self):
+        return bool(self.snapshots()) or os.path.exists(self.legacy_path)
+
+    def snapshots(self):
+        # snapshot ids, oldest first; ids are the UTC creation time in zero
+        # padded nanoseconds, they sort as strings
+        try:
+            names = os.listdir(self.snapshots_path)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-len('.json')] for name in names if name.endswith('.json'))
+
+    def snapshot_time(self, snapshot_id):
+        return int(snapshot_id) / 1e9
+
+    def snapshot_path(self, snapshot_id):
+        return os.path.join(self.snapshots_path, "{}.json".format(snapshot_id))
+
+    def new_snapshot_id(self, created):
+        created_ns = int(created * 1e9)
+        while os.path.exists(self.snapshot_path("{:020d}".format(created_ns))):
+            created_ns += 1
+        return "{:020d}".format(created_ns)
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_path, digest[:2], digest + self._COMPRESSED_SUFFIX)
+
+    def load_manifest(self, snapshot_id=None):
+        # latest snapshot unless asked otherwise
+        if snapshot_id is None:
+            snapshots = self.snapshots()
+            if not snapshots:
+                return {'created': None, 'files': {}}
+            snapshot_id = snapshots[-1]
+        with open(self.snapshot_path(snapshot_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_manifest(self, manifest):
+        os.makedirs(self.snapshots_path, exist_ok=True)
+        path = self.snapshot_path(self.new_snapshot_id(manifest['created']))
+        tmp_path = "{}.tmp".format(path)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+
+    def walk(self, base_dir, roots):
+        # yields (archive name, absolute path, stat) for every file under roots
+        for root in roots:
+            top = os.path.join(base_dir, root)
+            for dirpath, _, files in os.walk(top):
+                for name in files:
+                    path = os.path.join(dirpath, name)
+                    arcname = os.path.relpath(path, base_dir).replace(os.sep, '/')
+                    yield arcname, path, os.stat(path)
+
+    def store_file(self, path, cancel=None, on_chunk=None):
+        # single read: the content is hashed while it is deflated aside
+        os.makedirs(self.objects_path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.objects_path)
+        hasher = hashlib.sha1()
+        compressor = zlib.compressobj(self._COMPRESS_LEVEL)
+        try:
+            with open(path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+                for chunk in iter(lambda: src.read(self._CHUNK_SIZE), b''):
+                    if cancel is not None and cancel.is_set():
+                        raise BackupCancelled("Backup cancelled")
+                    hasher.update(chunk)
+                    dst.write(compressor.compress(chunk))
+                    if on_chunk is not None:
+                        on_chunk(len(chunk))
+                dst.write(compressor.flush())
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        digest = hasher.hexdigest()
+        if os.path.exists(self.object_path(digest)):
+            os.remove(tmp_path)
+            return digest
+        os.makedirs(os.path.dirname(self.object_path(digest)), exist_ok=True)
+        os.replace(tmp_path, self.object_path(digest))
+        return digest
+
+    @traced('backup')
+    def create(self, base_dir, roots, progress_callback=None, cancel=None, jobs=None):
+        cancel = cancel if cancel is not None else threading.Event()
+        previous = self.load_manifest()['files']
+        files = {}
+        changed = []
+        stats = {'files': 0, 'changed': 0, 'bytes_read': 0}
+        for arcname, path, stat in self.walk(base_dir, roots):
+            stats['files'] += 1
+            old = previous.get(arcname)
+            if (old is not None and old['size'] == stat.st_size and old['mtime'] == stat.st_mtime_ns
+                    and os.path.exists(self.object_path(old['hash']))):
+                files[arcname] = old
+                continue
+            changed.append((arcname, path, stat))
+
+        total = sum(stat.st_size for _, _, stat in changed)
+        lock = threading.Lock()
+        done = [0]
+
+        def on_chunk(size):
+            with lock:
+                done[0] += size
+                if progress_callback is not None:
+                    progress_callback(done[0], total)
+
+        if progress_callback is not None:
+            progress_callback(0, total)
+
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+            futures = {
+                pool.submit(self.store_file, path, cancel, on_chunk): (arcname, stat)
+                for arcname, path, stat in changed
+            }
+            try:
+                for future in as_completed(futures):
+                    arcname, stat = futures[future]
+                    files[arcname] = {
+                        'size': stat.st_size,
+                        'mtime': stat.st_mtime_ns,
+                        'hash': future.result(),
+                    }
+                    stats['changed'] += 1
+                    stats['bytes_read'] += stat.st_size
+            except BaseException:
+                # stop the other workers, the old manifest stays in place
+                cancel.set()
+                raise
+
+        if cancel.is_set():
+            raise BackupCancelled("Backup cancelled")
+        self.save_manifest({'created': time.time(), 'roots': list(roots), 'files': files})
+        Metrics().inc('backup_bytes_total', stats['bytes_read'])
+        stats['removed_snapshots'] = self.apply_retention()
+        stats['removed_objects'] = self.collect_garbage()
+        return stats
+
+    def expired_snapshots(self, now=None):
+        # keep the last N snapshots plus the newest one of each of the
+        # last keep_daily days and keep_weekly weeks that have any
+        snapshots = self.snapshots()
+        if not snapshots:
+            return []
+        newest_first = list(reversed(snapshots))
+        keep = set(newest_first[:max(self.keep_last, 1)])
+        days = []
+        weeks = []
+        for snapshot_id in newest_first:
+            day = time.localtime(self.snapshot_time(snapshot_id))
+            day_key = time.strftime('%Y%m%d', day)
+            week_key = time.strftime('%G-%V', day)
+            if day_key not in days and len(days) < self.keep_daily:
+                days.append(day_key)
+                keep.add(snapshot_id)
+            if week_key not in weeks and len(weeks) < self.keep_weekly:
+                weeks.append(week_key)
+                keep.add(snapshot_id)
+        return [snapshot_id for snapshot_id in snapshots if snapshot_id not in keep]
+
+    def apply_retention(self):
+        expired = self.expired_snapshots()
+        for snapshot_id in expired:
+            try:
+                os.remove(self.snapshot_path(snapshot_id))
+            except OSError as exc:
+                print(exc)
+        return len(expired)
+
+    def referenced_objects(self):
+        referenced = set()
+        for snapshot_id in self.snapshots():
+            for entry in self.load_manifest(snapshot_id)['files'].values():
+                referenced.add(os.path.basename(self.object_path(entry['hash'])))
+        return referenced
+
+    def collect_garbage(self):
+        # objects no snapshot points at anymore
+        referenced = self.referenced_objects()
+        removed = 0
+        if not os.path.isdir(self.objects_path):
+            return removed
+        for dirpath, _, names in os.walk(self.objects_path):
+            for name in names:
+                if name not in referenced and not name.endswith('.tmp'):
+                    try:
+                        os.remove(os.path.join(dirpath, name))
+                        removed += 1
+                    except OSError as exc:
+                        print(exc)
+        return removed
+
+    def hash_file(self, path):
+        hasher = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self._CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    @traced('restore_plan')
+    def plan_restore(self, base_dir, roots=CUSTOMS_ROOTS, snapshot_id=None):
+        # compares a snapshot with the current tree, nothing is written;
+        # files with the same size and mtime are trusted, the rest is hashed
+        # so a touched but identical texture is not rewritten
+        if snapshot_id is None:
+            # the plan is applied to the snapshot it was made from, even
+            # if a newer one is taken in the meantime
+            snapshots = self.snapshots()
+            snapshot_id = snapshots[-1] if snapshots else None
+        manifest = self.load_manifest(snapshot_id)
+        wanted = manifest['files']
+        plan = {'add': [], 'update': [], 'touch': [], 'delete': [], 'unchanged': 0, 'bytes': 0}
+        current = set()
+        for arcname, path, stat in self.walk(base_dir, manifest.get('roots') or roots):
+            current.add(arcname)
+            entry = wanted.get(arcname)
+            if entry is None:
+                plan['delete'].append(arcname)
+            elif entry['size'] != stat.st_size:
+                plan['update'].append(arcname)
+                plan['bytes'] += entry['size']
+            elif entry['mtime'] == stat.st_mtime_ns:
+                plan['unchanged'] += 1
+            elif self.hash_file(path) == entry['hash']:
+                plan['touch'].append(arcname)
+            else:
+                plan['update'].append(arcname)
+                plan['bytes'] += entry['size']
+        for arcname, entry in wanted.items():
+            if arcname not in current:
+                plan['add'].append(arcname)
+                plan['bytes'] += entry['size']
+        plan['snapshot'] = snapshot_id
+        return plan
+
+    @traced('restore')
+    def apply_restore(self, base_dir, plan):
+        wanted = self.load_manifest(plan['snapshot'])['files']
+        for arcname in plan['delete']:
+            try:
+                os.remove(os.path.join(base_dir, *arcname.split('/')))
+            except FileNotFoundError:
+                pass
+        for arcname in plan['add'] + plan['update']:
+            entry = wanted[arcname]
+            path = os.path.join(base_dir, *arcname.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # written aside first, an interrupted restore never leaves half a file
+            tmp_path = "{}.restore".format(path)
+            self.read_object(entry, tmp_path)
+            os.replace(tmp_path, path)
+            os.utime(path, ns=(entry['mtime'], entry['mtime']))
+        for arcname in plan['touch']:
+            entry = wanted[arcname]
+            os.utime(os.path.join(base_dir, *arcname.split('/')), ns=(entry['mtime'], entry['mtime']))
+        self.remove_empty_dirs(base_dir, plan['delete'])
+
+    def remove_empty_dirs(self, base_dir, arcnames):
+        # liveries whose files were all deleted leave their folder behind
+        dirs = set()
+        for arcname in arcnames:
+            parts = arcname.split('/')[:-1]
+            # never the roots themselves (e.g. Customs/Liveries)
+            while len(parts) > 2:
+                dirs.add('/'.join(parts))
+                parts = parts[:-1]
+        for dirname in sorted(dirs, key=len, reverse=True):
+            try:
+                os.rmdir(os.path.join(base_dir, *dirname.split('/')))
+            except OSError:
+                pass
+
+    def restore(self, base_dir, roots=CUSTOMS_ROOTS, snapshot_id=None):
+        # only files that differ from the snapshot are deleted or rewritten
+        if not self.snapshots():
+            # backups made before the incremental mode
+            for root in roots:
+                shutil.rmtree(os.path.join(base_dir, root), ignore_errors=True)
+                os.makedirs(os.path.join(base_dir, root), exist_ok=True)
+            with ZipFile(self.legacy_path, 'r') as zip_ref:
+                zip_ref.extractall(base_dir)
+            return None
+
+        plan = self.plan_restore(base_dir, roots, snapshot_id)
+        self.apply_restore(base_dir, plan)
+        return plan
+
+    def read_object(self, entry, path):
+        source = self.object_path(entry['hash'])
+        decompressor = zlib.decompressobj()
+        with open(source, 'rb') as src, open(path, 'wb') as dst:
+            for chunk in iter(lambda: src.read(self._CHUNK_SIZE), b''):
+                dst.write(decompressor.decompress(chunk))
+            dst.write(decompressor.flush())
@@ -1,19 +1,24 @@
 import os
 import shutil
-import tempfile
-import zipfile
 import requests
 import time
-import io
+import threading
+import json
+import hashlib
+
+from contextlib import contextmanager
 
 from datetime import datetime
 from pytz import timezone
 from requests.auth import HTTPBasicAuth
-from pathlib import Path
+from requests.adapters import HTTPAdapter
 from urllib.parse import urlparse
 
-from kivymd.app import MDApp
-from json.decoder import JSONDecodeError
+from .threads import Singleton, TaskScheduler
+from .config import DATA_HOME, ConfigService
+from .index import InstalledIndex
+from .metrics import Metrics
+from .ziputil import extract
 
 
 def cet_timestamp(ts):
@@ -22,50 +27,531 @@ def cet_timestamp(ts):
     return dt.timestamp()
 
 
-class HTTPClient:
+def content_range_start(value):
+    # "bytes 100-199/200" -> 100
+    try:
+        return int(value.split(' ', 1)[1].split('-', 1)[0])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def content_range_total(value):
+    # "bytes 100-199/200" or "bytes */200" -> 200
+    try:
+        return int(value.rsplit('/', 1)[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+_CHECKSUM_ALGORITHMS = {32: 'md5', 40: 'sha1', 64: 'sha256', 128: 'sha512'}
+
+
+def checksum_hasher(checksum):
+    # the manifest does not name the algorithm, the digest length does
+    if not isinstance(checksum, str) or not checksum:
+        return None
+    name = _CHECKSUM_ALGORITHMS.get(len(checksum))
+    if name is None:
+        return None
+    return hashlib.new(name)
+
+
+def seed_hasher(fd, hasher, offset):
+    # resumed bytes were hashed by a previous attempt that is gone now,
+    # read back just that prefix - the new bytes get hashed on the fly
+    if hasher is None or not offset:
+        return
+    fd.flush()
+    with open(fd.name, 'rb') as f:
+        remaining = offset
+        while remaining > 0:
+            chunk = f.read(min(65536, remaining))
+            if not chunk:
+                break
+            hasher.update(chunk)
+            remaining -= len(chunk)
+
+
+def verify_download(fd, hasher, checksum):
+    if hasher is None:
+        return
+    if hasher.hexdigest() != checksum.lower():
+        # never resume from corrupted bytes
+        fd.seek(0)
+        fd.truncate()
+        raise Exception("Checksum mismatch, the downloaded file is corrupted")
+
+
+# what the response to a (resumed) download request means for the spool file
+DOWNLOAD_COMPLETE = 'complete'
+DOWNLOAD_RESTART = 'restart'
+DOWNLOAD_RESUME = 'resume'
+DOWNLOAD_FULL = 'full'
+
+
+def download_action(offset, status, headers):
+    # returns (action, size of the whole file) from the status and
+    # Content-Range, anything unexpected raises
+    content_range = headers.get('Content-Range')
+    if offset and status == 416:
+        if content_range_total(content_range) == offset:
+            # everything has been spooled already
+            return DOWNLOAD_COMPLETE, offset
+        return DOWNLOAD_RESTART, None
+    if status == 206 and content_range_start(content_range) == offset:
+        max_size = content_range_total(content_range)
+        if max_size is None:
+            max_size = offset + int(headers.get('Content-Length', 0))
+        return DOWNLOAD_RESUME, max_size
+    if status == 200:
+        # server ignored the range, start from scratch
+        return DOWNLOAD_FULL, int(headers.get('Content-Length', 0))
+    raise Exception("Unable to download file, response code {}".format(status))
+
+
+# one attempt of writing a download to its spool file, both transports
+# only move the bytes: resuming, truncation, progress, the streaming
+# checksum and its verification are decided here
+class SpoolWriter:
+
+    def __init__(self, fd, checksum, progress_callback, span):
+        self.fd = fd
+        self.checksum = checksum
+        self.progress_callback = progress_callback
+        self.span = span
+        self.offset = fd.tell()
+        self.hasher = checksum_hasher(checksum)
+        self.max_size = None
+
+    def headers(self):
+        return {'Range': 'bytes={}-'.format(self.offset)} if self.offset else {}
+
+    def begin(self, status, headers):
+        # DOWNLOAD_COMPLETE and DOWNLOAD_RESTART responses have no body to
+        # write, after DOWNLOAD_RESTART the next attempt starts from zero
+        action, self.max_size = download_action(self.offset, status, headers)
+        if action in (DOWNLOAD_RESTART, DOWNLOAD_FULL):
+            self.offset = 0
+            self.fd.seek(0)
+            self.fd.truncate()
+        elif action == DOWNLOAD_RESUME:
+            Metrics().inc('download_resumed_total')
+        if self.offset:
+            self.progress_callback(self.max_size, self.offset)
+        return action
+
+    def seed(self):
+        # blocking, reads back the resumed prefix
+        seed_hasher(self.fd, self.hasher, self.offset)
+
+    def write(self, chunk):
+        self.fd.write(chunk)
+        self.span['bytes'] += len(chunk)
+        if self.hasher is not None:
+            self.hasher.update(chunk)
+        self.progress_callback(self.max_size, len(chunk))
+
+    def finish(self):
+        verify_download(self.fd, self.hasher, self.checksum)
+
+
+def data_path(*parts):
+    return os.path.join(os.environ.get('KIVY_HOME', DATA_HOME), *parts)
+
+
+def write_json_atomic(path, data):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = "{}.tmp".format(path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class ManifestUnavailable(Exception):
+    pass
+
+
+class ManifestCache:
+    # last known /api/skins/list response together with its validators,
+    # kept parsed in memory so a 304 costs neither a transfer nor a parse
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.server = None
+        self.etag = None
+        self.last_modified = None
+        self.fetched = None
+        self.skins = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict) or not isinstance(data.get('skins'), list):
+            return
+        self.server = data.get('server')
+        self.etag = data.get('etag')
+        self.last_modified = data.get('last_modified')
+        self.fetched = data.get('fetched')
+        self.skins = data['skins']
+
+    def get(self, server):
+        with self.lock:
+            if self.server != server:
+                return None
+            return self.skins
+
+    def headers(self, server):
+        with self.lock:
+            if self.server != server or self.skins is None:
+                return {}
+            headers = {}
+            if self.etag:
+                headers['If-None-Match'] = self.etag
+            if self.last_modified:
+                headers['If-Modified-Since'] = self.last_modified
+            return headers
+
+    def store(self, server, skins, etag, last_modified):
+        with self.lock:
+            self.server = server
+            self.skins = skins
+            self.etag = etag
+            self.last_modified = last_modified
+            self.fetched = time.time()
+            try:
+                write_json_atomic(self.path, {
+                    'server': server,
+                    'etag': etag,
+                    'last_modified': last_modified,
+                    'fetched': self.fetched,
+                    'skins': skins,
+                })
+            except OSError as exc:
+                print(exc)
+
+
+class InstallRecords(metaclass=Singleton):
+    # verified checksums of installed skins, a matching record means
+    # the skin on disk came from that exact archive
+
+    def __init__(self):
+        self.path = data_path('installed.json')
+        self.lock = threading.Lock()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.records = json.load(f)
+        except (OSError, ValueError):
+            self.records = {}
+
+    def get(self, key):
+        return self.records.get(key)
+
+    def set(self, key, checksum, remote_timestamp):
+        with self.lock:
+            self.records[key] = {'sum': checksum, 'timestamp': remote_timestamp}
+            try:
+                write_json_atomic(self.path, self.records)
+            except OSError as exc:
+                print(exc)
+
+    def remove(self, key):
+        with self.lock:
+            if self.records.pop(key, None) is not None:
+                try:
+                    write_json_atomic(self.path, self.records)
+                except OSError as exc:
+                    print(exc)
+
+
+class ArchiveCache(metaclass=Singleton):
+    # downloaded archives keyed by checksum (or skin and remote timestamp
+    # when the manifest has no checksum), evicted least recently used first
+
+    def __init__(self):
+        self.path = data_path('cache', 'archives')
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        os.makedirs(self.path, exist_ok=True)
+
+    @property
+    def size_limit(self):
+        return ConfigService().snapshot.getint('cache', 'archive_cache_mb', 0) * 1024 * 1024
+
+    def key_lock(self, key):
+        # the same archive requested by several leagues is fetched once,
+        # the others wait here and then find it in the cache
+        with self.lock:
+            if key not in self.key_locks:
+                self.key_locks[key] = threading.Lock()
+            return self.key_locks[key]
+
+    def entry_path(self, key):
+        return os.path.join(self.path, "{}.zip".format(key))
+
+    def get(self, key):
+        path = self.entry_path(key)
+        try:
+            os.utime(path, None)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, src_path):
+        if self.size_limit <= 0:
+            return None
+        path = self.entry_path(key)
+        os.replace(src_path, path)
+        self.evict(keep=path)
+        return path
+
+    def discard(self, key):
+        try:
+            os.remove(self.entry_path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self, keep=None):
+        with self.lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.path):
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+            limit = self.size_limit
+            for _, size, path in sorted(entries):
+                if total <= limit:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError as exc:
+                    print(exc)
+                    continue
+                total -= size
+
+
+class TokenBucket:
+    # global download rate limit in bytes per second, 0 means unlimited,
+    # waiting threads re-check the rate so changes apply immediately
+
+    def __init__(self, rate=0):
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.tokens = 0.0
+        self.last = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def set_rate(self, rate):
+        with self.lock:
+            self._refill()
+            self.rate = max(rate, 0)
+            self.tokens = min(self.tokens, self.rate)
+
+    def take(self, amount):
+        # returns how long the caller has to wait for its bytes
+        with self.lock:
+            if self.rate <= 0:
+                return 0
+            self._refill()
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def deficit(self):
+        with self.lock:
+            if self.rate <= 0:
+                self.tokens = 0.0
+                return 0
+            self._refill()
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def consume(self, amount):
+        wait = self.take(amount)
+        while wait > 0:
+            time.sleep(min(wait, 0.1))
+            wait = self.deficit()
+
+
+class HostLimiter:
+    # caps concurrent connections per host, 0 means unlimited
+
+    def __init__(self, limit=0):
+        self.cond = threading.Condition()
+        self.limit = limit
+        self.active = {}
+
+    def set_limit(self, limit):
+        with self.cond:
+            self.limit = max(limit, 0)
+            self.cond.notify_all()
+
+    @contextmanager
+    def slot(self, host):
+        with self.cond:
+            while self.limit > 0 and self.active.get(host, 0) >= self.limit:
+                self.cond.wait()
+            self.active[host] = self.active.get(host, 0) + 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.active[host] -= 1
+                self.cond.notify_all()
+
+
+class ClientRegistry(metaclass=Singleton):
+    # one keep-alive session shared by all widgets and screens,
+    # the pool is sized to the number of download workers
 
     def __init__(self):
-        self.config = MDApp.get_running_app().config
-        self.set_config()
+        self.lock = threading.Lock()
+        self.pool_size = None
+        self.bandwidth = TokenBucket()
+        self.hosts = HostLimiter()
+        self.session = requests.Session()
+        self.adapter = None
+        self.resize_pool(TaskScheduler().workers_num)
+        self._http_client = None
+        Metrics().add_collector(self.gauges)
 
-    def set_config(self):
-        self.user = self.config.get('generic', 'user')
-        self.password = self.config.get('generic', 'password')
-        self.server = self.config.get('generic', 'server')
+    def resize_pool(self, pool_size):
+        if pool_size == self.pool_size:
+            return
+        self.pool_size = pool_size
+        adapter, self.adapter = self.adapter, HTTPAdapter(pool_connections=self.pool_size,
+                                                          pool_maxsize=self.pool_size)
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        if adapter is not None:
+            # idle sockets of the old pools, requests still running on them
+            # finish and their connections are discarded
+            adapter.close()
+
+    @property
+    def http_client(self):
+        with self.lock:
+            if self._http_client is None:
+                self._http_client = HTTPClient(self.session, self.bandwidth, self.hosts)
+            return self._http_client
+
+    def gauges(self):
+        # keep-alive reuse of the shared pools, summed over all hosts
+        totals = {'http_connections': 0, 'http_requests': 0, 'http_connections_reused': 0,
+                  'http_connections_idle': 0}
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            totals['http_connections'] += pool.num_connections
+            totals['http_requests'] += pool.num_requests
+            totals['http_connections_reused'] += max(pool.num_requests - pool.num_connections, 0)
+            if pool.pool is not None:
+                # the queue is padded with None up to the pool size
+                totals['http_connections_idle'] += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        return totals
+
+
+class HTTPClient:
+
+    def __init__(self, session, bandwidth, hosts):
+        self.session = session
+        self.bandwidth = bandwidth
+        self.hosts = hosts
+        self.auth = None
+        self.manifest = ManifestCache(data_path('manifest.json'))
+        self.set_config(ConfigService().snapshot)
+        # running downloads share the limits, new values apply right away
+        ConfigService().subscribe(self.set_config, sections=('generic',))
+
+    def set_config(self, config):
+        self.user = config.get('generic', 'user')
+        self.password = config.get('generic', 'password')
+        self.server = config.get('generic', 'server')
         self.scheme = urlparse(self.server)
-    
-    def _refresh_config(func):
-        def wrapper(self, *args, **kwargs):
-            self.set_config()
-            return func(self, *args, **kwargs)
-        return wrapper
-
-    @_refresh_config
+        if self.auth is None or (self.auth.username, self.auth.password) != (self.user, self.password):
+            self.auth = HTTPBasicAuth(self.user, self.password)
+            self.session.auth = self.auth
+        self.bandwidth.set_rate(config.getint('generic', 'max_bandwidth', 0) * 1024)
+        self.hosts.set_limit(config.getint('generic', 'max_connections_per_host', 0))
+
     def ping(self):
-        resp = requests.get(self.server, auth=HTTPBasicAuth(self.user, self.password))
+        resp = self.session.get(self.server)
         if resp.status_code != 200:
             raise Exception("Response code {}".format(resp.status_code))
 
-    @_refresh_config
-    def list_skins(self):
+    def cached_skins(self):
+        # last known manifest of this server, no network round trip
+        return self.manifest.get(self.server)
+
+    def fetch_skins(self):
+        # raises ManifestUnavailable when the server answers without a
+        # usable manifest, requests errors when it cannot be reached
         endpoint = self.server + "/api/skins/list"
-        resp = requests.get(endpoint, auth=HTTPBasicAuth(self.user, self.password))
+        with Metrics().span('manifest') as span:
+            resp = self.session.get(endpoint, headers=self.manifest.headers(self.server))
+            span['status'] = resp.status_code
+        Metrics().inc('manifest_requests_total', status=resp.status_code)
+        cached = self.manifest.get(self.server)
+        if resp.status_code == 304 and cached is not None:
+            return cached
+
         try:
-            return resp.json()
-        except JSONDecodeError:
-            return []
+            skins = resp.json() if resp.status_code == 200 else None
+        except ValueError:
+            skins = None
 
-    @_refresh_config
-    def download_file(self, endpoint, file, progress_callback):
-        # TODO: validate this, it's very optimistic
-        with file as fd:
-            resp = requests.get(self.server + endpoint, auth=HTTPBasicAuth(self.user, self.password), stream=True)
-            if resp.status_code != 200:
-                raise Exception("Unable to download file, response code {}".format(resp.status_code))
-            max_size = int(resp.headers.get('Content-Length', 0))
-            for chunk in resp.iter_content(chunk_size=65536):
-                fd.write(chunk)
-                progress_callback(max_size, len(chunk))
+        if not isinstance(skins, list):
+            Metrics().inc('manifest_failures_total')
+            raise ManifestUnavailable("No skin list from the server, response code {}".format(resp.status_code))
+
+        self.manifest.store(self.server, skins, resp.headers.get('ETag'), resp.headers.get('Last-Modified'))
+        return skins
+
+    def list_skins(self):
+        try:
+            return self.fetch_skins()
+        except ManifestUnavailable as exc:
+            # corrupt, empty or failed response - serve the last known manifest
+            print(exc)
+            cached = self.cached_skins()
+            return cached if cached is not None else []
+
+    def download_file(self, endpoint, file, progress_callback, checksum=None):
+        # the file is opened for appending, whatever is already spooled
+        # gets resumed with a Range request
+        metrics = Metrics()
+        with file as fd, self.hosts.slot(self.scheme.netloc), metrics.span('download') as span:
+            span['bytes'] = 0
+            for attempt in range(2):
+                if attempt:
+                    metrics.inc('download_retries_total')
+                spool = SpoolWriter(fd, checksum, progress_callback, span)
+                with self.session.get(self.server + endpoint, stream=True, headers=spool.headers()) as resp:
+                    action = spool.begin(resp.status_code, resp.headers)
+                    if action == DOWNLOAD_RESTART:
+                        continue
+                    spool.seed()
+                    if action != DOWNLOAD_COMPLETE:
+                        for chunk in resp.iter_content(chunk_size=65536):
+                            self.bandwidth.consume(len(chunk))
+                            spool.write(chunk)
+                    spool.finish()
+                    return
+            raise Exception("Unable to resume download of {}".format(endpoint))
 
 
 class LocalFileClient:
@@ -73,23 +559,23 @@ class LocalFileClient:
     def __init__(self, skin_type, car_name, skin_name, skin_ext):
         # TODO: validate this, it's very optimistic
         # TODO: refactor this to subclasses
-        self.config = MDApp.get_running_app().config
         self.skin_type = skin_type
         self.car_name = car_name
         self.skin_name = skin_name
         self.skin_ext = skin_ext
         self.temp = None
-        self.set_config()
+        self.config_version = None
+        self.refresh_config()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.delete_temp()
 
-    def set_config(self):
-        cars_dir = self.config.get(self.skin_type, "skins_dir")
+    def set_config(self, config):
+        cars_dir = config.get(self.skin_type, "skins_dir")
         if self.skin_type == 'ac':
             self.car_path = "{}/{}".format(cars_dir, self.car_name)
             self.extract_path = "{}/skins".format(self.car_path)
-            self.skin_path = "{}/{}".format(self.extract_path, self.name)
+            self.skin_path = "{}/{}".format(self.extract_path, self.skin_name)
         elif self.skin_type == 'acc':
             self.car_path = "{}/Customs/Cars/{}.json".format(cars_dir, self.skin_name)
             self.extract_path = cars_dir
@@ -97,52 +583,117 @@ class LocalFileClient:
         else:
             raise Exception("Invalid skin type: {}".format(self.skin_type))
 
-    def _refresh_config(func):
-        def wrapper(self, *args, **kwargs):
-            self.set_config()
-            return func(self, *args, **kwargs)
-        return wrapper
+    def refresh_config(self):
+        # paths are rebuilt only when a new snapshot has been published,
+        # thousands of skins share one snapshot instead of subscribing each
+        config = ConfigService().snapshot
+        if config.version != self.config_version:
+            self.set_config(config)
+            self.config_version = config.version
 
     @property
-    @_refresh_config
     def car_exists(self):
-        path = Path(self.car_path)
-        if self.skin_type == 'ac':
-            return path.is_dir()
-        elif self.skin_type == 'acc':
-            return path.is_file()
+        return InstalledIndex().car_exists(self.skin_type, self.car_name, self.skin_name)
 
     @property
-    @_refresh_config
     def skin_exists(self):
-        path = Path(self.skin_path)
-        return path.is_dir()
+        return self.timestamp is not None
 
     @property
-    @_refresh_config
     def timestamp(self):
-        if not self.skin_exists:
+        mtime = InstalledIndex().skin_mtime(self.skin_type, self.car_name, self.skin_name)
+        if mtime is None:
             return None
-        return cet_timestamp(os.path.getmtime(self.skin_path))
+        return cet_timestamp(mtime)
+
+    def is_verified(self, checksum):
+        # installed from an archive with this exact checksum
+        if checksum_hasher(checksum) is None:
+            return False
+        record = InstallRecords().get(self.spool_key)
+        return record is not None and record.get('sum') == checksum.lower()
+
+    def record_install(self, checksum, remote_timestamp):
+        if checksum_hasher(checksum) is None:
+            InstallRecords().remove(self.spool_key)
+        else:
+            InstallRecords().set(self.spool_key, checksum.lower(), remote_timestamp)
+
+    def forget_install(self):
+        InstallRecords().remove(self.spool_key)
 
-    def create_temp(self):
-        self.temp = tempfile.NamedTemporaryFile(delete=False, suffix=".{}".format(self.skin_ext))
+    def archive_key(self, checksum, remote_timestamp):
+        if checksum_hasher(checksum) is not None:
+            return checksum.lower()
+        return "{}@{}".format(self.spool_key, remote_timestamp)
+
+    @property
+    def spool_key(self):
+        return "{}_{}_{}".format(self.skin_type, self.car_name, self.skin_name)
+
+    def create_temp(self, remote_timestamp):
+        # partial downloads are spooled per skin and remote version,
+        # so retries and restarts continue where the last attempt stopped
+        spool_dir = data_path('spool')
+        os.makedirs(spool_dir, exist_ok=True)
+        prefix = "{}@".format(self.spool_key)
+        name = "{}{}.{}.part".format(prefix, remote_timestamp, self.skin_ext)
+        for entry in os.scandir(spool_dir):
+            if entry.name.startswith(prefix) and entry.name != name:
+                # remote version changed, the old bytes are useless now
+                try:
+                    os.remove(entry.path)
+                except OSError as exc:
+                    print(exc)
+        self.temp = open(os.path.join(spool_dir, name), 'ab')
         return self.temp
 
     def delete_temp(self):
         if self.temp is not None:
-            shutil.rmtree(self.temp.name, ignore_errors=True)
+            self.temp.close()
+            try:
+                os.remove(self.temp.name)
+            except FileNotFoundError:
+                pass
+            self.temp = None
 
-    @_refresh_config
-    def extract_temp(self):
+    def cache_temp(self, key):
+        # hand the finished download over to the archive cache, returns
+        # None when caching is disabled and the temp file must be used
         self.temp.close()
         try:
-            with zipfile.ZipFile(self.temp.name, 'r') as zip_ref:
-                zip_ref.extractall(self.extract_path)
-            mod_time = cet_timestamp(time.time())
-            os.utime(self.skin_path, (mod_time, mod_time))
+            path = ArchiveCache().put(key, self.temp.name)
+        except OSError as exc:
+            print(exc)
+            return None
+        if path is not None:
+            self.temp = None
+        return path
+
+    def extract_archive(self, archive_path, progress_callback=None):
+        self.refresh_config()
+        metrics = Metrics()
+        try:
+            with metrics.span('extract', game=self.skin_type) as span:
+                span['bytes'] = os.path.getsize(archive_path)
+                extract(archive_path, self.extract_path, progress_callback)
+            self.mark_installed()
         except Exception as exc:
+            InstallRecords().remove(self.spool_key)
+            InstalledIndex().remove_skin(self.skin_type, self.car_name, self.skin_name)
             shutil.rmtree(self.skin_path)
             raise exc
+
+    def mark_installed(self):
+        with Metrics().span('utime', game=self.skin_type):
+            mod_time = cet_timestamp(time.time())
+            os.utime(self.skin_path, (mod_time, mod_time))
+            InstalledIndex().update_skin(self.skin_type, self.car_name, self.skin_name,
+                                         os.path.getmtime(self.skin_path))
+
+    def extract_temp(self, progress_callback=None):
+        self.temp.close()
+        try:
+            self.extract_archive(self.temp.name, progress_callback)
         finally:
             self.delete_temp()
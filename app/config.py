@@ -0,0 +1,188 @@
+import os
+import threading
+
+from configparser import ConfigParser
+from pathlib import Path
+from types import MappingProxyType
+
+from .threads import Singleton
+
+
+DATA_HOME = r'{}\Documents\Simrace Content Manager'.format(Path.home())
+
+# where kivy keeps the GUI settings (App.get_application_config of the
+# "App" class: <app dir>/<app name>.ini with an empty app name)
+APP_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.ini')
+
+
+def default_ac_dir():
+    try:
+        import winreg
+        hkey = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, "SOFTWARE\\WOW6432Node\\Valve\\Steam")
+        steam_path = winreg.QueryValueEx(hkey, "InstallPath")[0]
+        winreg.CloseKey(hkey)
+    except Exception as exc:
+        print(exc)
+        return ""
+    else:
+        if steam_path == "":
+            return ""
+        return r'{}\steamapps\common\assettocorsa\content\cars'.format(steam_path)
+
+
+def default_acc_dir():
+    d = Path(r'{}\Documents\Assetto Corsa Competizione'.format(Path.home()))
+    if d.exists():
+        return str(d.absolute())
+    return ""
+
+
+def defaults():
+    return {
+        'generic': {
+            'user': '',
+            'password': '',
+            'server': 'https://esport.simrace.pl',
+            'workers': '3',
+            'max_bandwidth': '0',
+            'max_connections_per_host': '0',
+            'prefetch_leagues': '1',
+            'fs_poll_interval': '5',
+            'transport': 'threads',
+            'async_concurrency': '32',
+            'delta_sync': '1',
+        },
+        'ac': {
+            'skins_dir': default_ac_dir(),
+        },
+        'acc': {
+            'skins_dir': default_acc_dir(),
+        },
+        'cache': {
+            'archive_cache_mb': '2048',
+        },
+        'backup': {
+            'destination_path': "{}\\backup".format(os.environ.get('KIVY_HOME', DATA_HOME)),
+            'keep_last': '5',
+            'keep_daily': '7',
+            'keep_weekly': '4',
+        },
+        'metrics': {
+            # JSON lines of every span, rotated at events_max_mb
+            'events_file': os.path.join(os.environ.get('KIVY_HOME', DATA_HOME), 'metrics', 'events.jsonl'),
+            'events_max_mb': '10',
+            'events_backups': '3',
+            # Prometheus text format, empty file / port 0 disables the export
+            'prometheus_file': '',
+            'prometheus_port': '0',
+            'export_interval': '15',
+        },
+    }
+
+
+def load_config(path=APP_CONFIG_PATH):
+    # the same settings the GUI uses, without kivy
+    config = ConfigParser(interpolation=None)
+    config.read_dict(defaults())
+    config.read(path, encoding='utf-8')
+    return config
+
+
+class ConfigSnapshot:
+    # read only copy of the settings at one point in time, reading it
+    # costs a dict lookup instead of a ConfigParser round trip
+
+    _BOOLEAN_STATES = ConfigParser.BOOLEAN_STATES
+
+    def __init__(self, values, version):
+        self._values = MappingProxyType({section: MappingProxyType(dict(options))
+                                         for section, options in values.items()})
+        self.version = version
+
+    def section(self, section):
+        return self._values.get(section, MappingProxyType({}))
+
+    def get(self, section, name, fallback=None):
+        return self.section(section).get(name, fallback)
+
+    def getint(self, section, name, fallback=None):
+        try:
+            return int(self.get(section, name))
+        except (TypeError, ValueError):
+            if fallback is None:
+                raise ValueError("Invalid integer for {}/{}".format(section, name))
+            return fallback
+
+    def getfloat(self, section, name, fallback=None):
+        try:
+            return float(self.get(section, name))
+        except (TypeError, ValueError):
+            if fallback is None:
+                raise ValueError("Invalid number for {}/{}".format(section, name))
+            return fallback
+
+    def getboolean(self, section, name, fallback=None):
+        value = str(self.get(section, name)).lower()
+        if value not in self._BOOLEAN_STATES:
+            if fallback is None:
+                raise ValueError("Invalid boolean for {}/{}".format(section, name))
+            return fallback
+        return self._BOOLEAN_STATES[value]
+
+    def changed_sections(self, other):
+        if other is None:
+            return set(self._values)
+        sections = set(self._values) | set(other._values)
+        return set(section for section in sections if dict(self.section(section)) != dict(other.section(section)))
+
+
+# single source of settings: the GUI hands over its kivy config, the command
+# line a plain ConfigParser; every write is followed by publish() and only
+# subscribers of the sections that changed get called with the new snapshot
+class ConfigService(metaclass=Singleton):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.config = None
+        self.current = None
+        self.version = 0
+        self.subscribers = []
+
+    def use(self, config):
+        self.config = config
+        self.publish()
+
+    @property
+    def snapshot(self):
+        if self.current is None:
+            raise Exception("Configuration is not loaded")
+        return self.current
+
+    def subscribe(self, callback, sections=None):
+        # sections=None means every change
+        self.subscribers.append((callback, set(sections) if sections is not None else None))
+
+    def unsubscribe(self, callback):
+        self.subscribers = [(cb, sections) for cb, sections in self.subscribers if cb != callback]
+
+    def publish(self):
+        with self.lock:
+            values = {section: {name: self.config.get(section, name) for name in self.config.options(section)}
+                      for section in self.config.sections()}
+            previous = self.current
+            snapshot = ConfigSnapshot(values, self.version + 1)
+            changed = snapshot.changed_sections(previous)
+            if previous is not None and not changed:
+                # nothing changed, cached state built from the old snapshot stays valid
+                return previous
+            self.version += 1
+            self.current = snapshot
+        if previous is None:
+            return self.current
+        for callback, sections in list(self.subscribers):
+            if sections is None or sections & changed:
+                try:
+                    callback(self.current)
+                except Exception as exc:
+                    print(exc)
+        return self.current
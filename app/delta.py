@@ -0,0 +1,189 @@
+import os
+import io
+import zlib
+
+from zipfile import ZipFile
+
+from .clients import content_range_start, content_range_total
+from .ziputil import member_path, extract_member
+
+
+# the end of central directory record and, for skin sized archives, the
+# whole central directory fit in the last 64 KiB
+_TAIL_SIZE = 64 * 1024
+_READ_SIZE = 64 * 1024
+# largest single request, members next to each other share requests
+_WINDOW_SIZE = 16 * 1024 * 1024
+# above this share of the archive a plain download is cheaper
+_MAX_RATIO = 0.7
+_CHUNK_SIZE = 1024 * 1024
+
+
+class DeltaUnavailable(Exception):
+    pass
+
+
+# read only, seekable view of a remote archive, every read outside the
+# buffer is an HTTP Range request; all requests carry If-Range so a new
+# archive uploaded in the middle aborts instead of mixing two versions
+class RemoteZip(io.RawIOBase):
+
+    def __init__(self, http_client, endpoint):
+        super(RemoteZip, self).__init__()
+        self.http_client = http_client
+        self.url = http_client.server + endpoint
+        self.validator = None
+        self.pos = 0
+        self.window_end = 0
+        self.fetched = 0
+        self.buffer = b''
+        self.buffer_start = 0
+
+        resp = self.request('bytes=-{}'.format(_TAIL_SIZE))
+        self.validator = resp.headers.get('ETag') or resp.headers.get('Last-Modified')
+        self.size = content_range_total(resp.headers.get('Content-Range'))
+        if self.size is None:
+            raise DeltaUnavailable("Unknown archive size of {}".format(self.url))
+        self.buffer = resp.content
+        self.buffer_start = self.size - len(self.buffer)
+
+    def request(self, value):
+        headers = {'Range': value}
+        if self.validator:
+            headers['If-Range'] = self.validator
+        with self.http_client.hosts.slot(self.http_client.scheme.netloc):
+            # streamed, a server that ignores the range must not send the
+            # whole archive before it is refused
+            resp = self.http_client.session.get(self.url, headers=headers, stream=True)
+            if resp.status_code != 206:
+                resp.close()
+                # no range support or the archive changed on the server
+                raise DeltaUnavailable("Range request refused, response code {}".format(resp.status_code))
+            content = resp.content
+        self.http_client.bandwidth.consume(len(content))
+        self.fetched += len(content)
+        return resp
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.pos = max(offset, 0)
+        return self.pos
+
+    def window(self, end):
+        # reads up to end come in _WINDOW_SIZE requests instead of small ones
+        self.window_end = end
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.pos
+        size = min(size, self.size - self.pos)
+        if size <= 0:
+            return b''
+        offset = self.pos - self.buffer_start
+        if offset < 0 or offset + size > len(self.buffer):
+            if self.pos < self.window_end:
+                end = min(self.window_end, self.pos + _WINDOW_SIZE)
+            else:
+                end = self.pos + _READ_SIZE
+            end = min(max(end, self.pos + size), self.size)
+            resp = self.request('bytes={}-{}'.format(self.pos, end - 1))
+            if content_range_start(resp.headers.get('Content-Range')) != self.pos:
+                raise DeltaUnavailable("Unexpected range from {}".format(self.url))
+            self.buffer = resp.content
+            self.buffer_start = self.pos
+            offset = 0
+        data = self.buffer[offset:offset + size]
+        self.pos += len(data)
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+def file_crc32(path):
+    crc = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def plan_members(zf, dest):
+    # members whose installed copy differs: missing, other size or other CRC
+    changed = []
+    for zinfo in zf.infolist():
+        if zinfo.is_dir():
+            continue
+        path = member_path(dest, zinfo.filename)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            changed.append((zinfo, path))
+            continue
+        if size != zinfo.file_size or file_crc32(path) != zinfo.CRC:
+            changed.append((zinfo, path))
+    return changed
+
+
+def member_ends(zf):
+    # header offset -> where the member's data ends in the archive
+    offsets = sorted(zinfo.header_offset for zinfo in zf.infolist()) + [zf.start_dir]
+    return dict(zip(offsets, offsets[1:]))
+
+
+def sync_members(http_client, endpoint, dest, progress_callback=None):
+    # updates an installed skin in place from the remote archive: only
+    # members that differ are fetched, each is checked against its CRC
+    # while inflating and replaces the old file atomically
+    with RemoteZip(http_client, endpoint) as remote, ZipFile(remote) as zf:
+        changed = plan_members(zf, dest)
+        ends = member_ends(zf)
+        needed = sum(ends[zinfo.header_offset] - zinfo.header_offset for zinfo, _ in changed)
+        if needed > remote.size * _MAX_RATIO:
+            raise DeltaUnavailable("{} of {} bytes changed".format(needed, remote.size))
+
+        done = 0
+        if progress_callback is not None:
+            progress_callback(done, needed)
+        changed.sort(key=lambda member: member[0].header_offset)
+        run_end = 0
+        for i, (zinfo, path) in enumerate(changed):
+            if zinfo.header_offset >= run_end:
+                # one request for this member and the changed ones right after it
+                run_end = ends[zinfo.header_offset]
+                for next_zinfo, _ in changed[i + 1:]:
+                    if next_zinfo.header_offset != run_end:
+                        break
+                    run_end = ends[next_zinfo.header_offset]
+                remote.window(run_end)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = "{}.delta".format(path)
+            try:
+                extract_member(zf, zinfo, tmp_path)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            done += ends[zinfo.header_offset] - zinfo.header_offset
+            if progress_callback is not None:
+                progress_callback(done, needed)
+        return {
+            'files': len(zf.infolist()),
+            'changed': len(changed),
+            'archive_bytes': remote.size,
+            'fetched_bytes': remote.fetched,
+        }
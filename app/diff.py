@@ -0,0 +1,94 @@
+import bisect
+
+
+ADD = 'add'
+REMOVE = 'remove'
+UPDATE = 'update'
+MOVE = 'move'
+
+
+def stable_positions(positions):
+    # indexes of a longest increasing subsequence of positions, those
+    # items keep their relative order and never have to move
+    tails = []
+    tail_index = []
+    parents = [None] * len(positions)
+    for i, position in enumerate(positions):
+        j = bisect.bisect_left(tails, position)
+        if j == len(tails):
+            tails.append(position)
+            tail_index.append(i)
+        else:
+            tails[j] = position
+            tail_index[j] = i
+        parents[i] = tail_index[j - 1] if j else None
+    stable = set()
+    i = tail_index[-1] if tail_index else None
+    while i is not None:
+        stable.add(i)
+        i = parents[i]
+    return stable
+
+
+def diff_lists(old, new, key):
+    # keyed diff, O(n log n): returns operations that turn old into new,
+    #   (REMOVE, key, old index, None)
+    #   (MOVE, key, new index, item)
+    #   (ADD, key, new index, item)
+    #   (UPDATE, key, new index, item)
+    # equal lists give no operations at all
+    old_index = {key(item): i for i, item in enumerate(old)}
+    new_keys = [key(item) for item in new]
+    new_set = set(new_keys)
+
+    ops = []
+    for i, item in enumerate(old):
+        if key(item) not in new_set:
+            ops.append((REMOVE, key(item), i, None))
+
+    common = [(i, old_index[k]) for i, k in enumerate(new_keys) if k in old_index]
+    stable = stable_positions([position for _, position in common])
+    moved = set(new_keys[i] for n, (i, _) in enumerate(common) if n not in stable)
+
+    for i, (k, item) in enumerate(zip(new_keys, new)):
+        if k not in old_index:
+            ops.append((ADD, k, i, item))
+        elif k in moved:
+            ops.append((MOVE, k, i, item))
+        elif old[old_index[k]] != item:
+            ops.append((UPDATE, k, i, item))
+    return ops
+
+
+def apply_ops(items, ops, old_keys, convert=None):
+    # applies diff_lists operations in place to a list that mirrors the old
+    # one (e.g. RecycleView data), old_keys are the keys of its items;
+    # convert maps a manifest item to the list item
+    convert = convert or (lambda item: item)
+    old_index = {k: i for i, k in enumerate(old_keys)}
+    gone = sorted((old_index[k] if op == MOVE else index for op, k, index, _ in ops
+                   if op == REMOVE or op == MOVE), reverse=True)
+    # removed and moved items leave first, what stays is in the new order
+    for index in gone:
+        del items[index]
+    for op, k, index, item in ops:
+        if op == ADD or op == MOVE:
+            items.insert(index, convert(item))
+        elif op == UPDATE:
+            items[index] = convert(item)
+    return items
+
+
+def diff_manifest(old, new):
+    # old and new map league id -> [(skin id, skin, skin type)], only
+    # leagues with changes are returned, each with its list operations
+    changes = {}
+    for league_id in set(old) | set(new):
+        old_skins = old.get(league_id, [])
+        new_skins = new.get(league_id, [])
+        if old_skins == new_skins:
+            continue
+        ops = diff_lists(old_skins, new_skins, key=lambda entry: entry[0])
+        if ops:
+            changes[league_id] = ops
+    return changes
@@ -15,8 +15,8 @@ class CustomDispatcher(EventDispatcher):
         self.register_event_type('on_open_backup')
         self.register_event_type('on_open_zip_skin')
 
-    def do_initialize(self, *args):
-        self.dispatch('on_initialize')
+    def do_initialize(self, skins):
+        self.dispatch('on_initialize', skins)
 
     def do_refresh(self, *args):
         self.dispatch('on_refresh')
@@ -36,7 +36,7 @@ class CustomDispatcher(EventDispatcher):
     def do_open_zip_skin(self, *args):
         self.dispatch('on_open_zip_skin')
 
-    def on_initialize(self):
+    def on_initialize(self, skins):
         # add debug log here
         pass
 
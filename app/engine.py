@@ -0,0 +1,202 @@
+import os
+import time
+
+from functools import partial
+from concurrent.futures import as_completed
+
+from .config import ConfigService
+from .clients import LocalFileClient, ClientRegistry, ArchiveCache
+from .delta import sync_members
+from .metrics import Metrics
+from .threads import TaskScheduler, PRIORITY_NORMAL
+from .transport import AsyncTransport, selected_transport, TRANSPORT_ASYNCIO
+
+
+STATE_MISSING = "missing"
+STATE_RECREATE = "recreate"
+STATE_DOWNLOAD = "download"
+STATE_UPDATE = "update"
+
+# game_id of the manifest -> skin type
+GAME_TYPES = {1: 'acc', 2: 'ac'}
+
+
+def skin_type_of(skin):
+    try:
+        return GAME_TYPES.get(int(skin['game_id']))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+# one manifest entry and everything needed to install it, shared by
+# the GUI (SkinModel) and the command line (SyncEngine)
+class SkinJob:
+
+    def __init__(self, league_id, skin, skin_type):
+        self.league_id = league_id
+        self.skin_type = skin_type
+        self.sum_control = skin.get('sum')
+        self.skin_name, self.skin_ext = skin.get('skin_name').split('.')
+
+        # HACKY - FIX ME, the field should not be called car_name
+        s = self.skin_name.split("-")
+        self.car_name = s[1]
+        # END OF FIX ME
+
+        self.remote_skin_path = '/api/skins/{}/{}/{}/download'.format(self.league_id, self.car_name, self.skin_name)
+        self.remote_timestamp = skin.get('timestamp')
+        self.local_file = LocalFileClient(self.skin_type, self.car_name, self.skin_name, self.skin_ext)
+
+    @property
+    def key(self):
+        return self.local_file.spool_key
+
+    def state(self):
+        if not self.local_file.car_exists and self.skin_type == 'ac':
+            # Car files missing - cannot install skins
+            return STATE_MISSING
+        elif self.local_file.car_exists and self.local_file.skin_exists:
+            if not self.local_file.is_verified(self.sum_control) and self.remote_timestamp > self.local_file.timestamp:
+                # Files downloaded but new version discovered on the server - update phase
+                return STATE_UPDATE
+            # Files downloaded, everything up to date - recreate phase
+            return STATE_RECREATE
+        # Skin files missing - download phase
+        return STATE_DOWNLOAD
+
+    def install(self, http_client, download_progress=None, install_progress=None, on_install=None):
+        # runs on a worker thread: cached archive or (resumed) download,
+        # checksum verification, extraction and the install record
+        download_progress = download_progress or (lambda max_size, chunk_size: None)
+        archive_cache = ArchiveCache()
+        key = self.local_file.archive_key(self.sum_control, self.remote_timestamp)
+        with archive_cache.key_lock(key):
+            archive = archive_cache.get(key)
+            if archive is None and self.sync_delta(http_client, download_progress):
+                return
+            if archive is None:
+                temp_file = self.local_file.create_temp(self.remote_timestamp)
+                http_client.download_file(self.remote_skin_path, temp_file, download_progress, self.sum_control)
+                archive = self.local_file.cache_temp(key)
+            else:
+                # unchanged archive is already on disk - recreate locally
+                size = os.path.getsize(archive)
+                download_progress(size, size)
+
+            if on_install is not None:
+                on_install()
+            self.finish(key, archive, install_progress)
+
+    def sync_delta(self, http_client, download_progress):
+        # an installed skin is patched with the members that changed instead
+        # of downloading the whole archive again; False means a full download
+        # is needed (not installed, disabled, no range support, most changed)
+        if not self.local_file.skin_exists:
+            return False
+        if not ConfigService().snapshot.getboolean('generic', 'delta_sync', True):
+            return False
+        reported = [0]
+
+        def progress(done, total):
+            download_progress(total, done - reported[0])
+            reported[0] = done
+
+        self.local_file.refresh_config()
+        try:
+            with Metrics().span('delta', game=self.skin_type) as span:
+                stats = sync_members(http_client, self.remote_skin_path, self.local_file.extract_path, progress)
+                span.update(stats)
+                span['bytes'] = stats['fetched_bytes']
+        except Exception as exc:
+            print("Delta update of {} not possible: {}".format(self.skin_name, exc))
+            # the full download reports its progress from zero
+            download_progress(0, -reported[0])
+            return False
+        self.local_file.mark_installed()
+        # the members passed their CRCs, but the archive checksum cannot be
+        # checked without the whole archive - the skin is not verified
+        self.local_file.forget_install()
+        return True
+
+    def finish(self, key, archive, install_progress=None):
+        # archive None means the download is still in the spool file
+        if archive is None:
+            self.local_file.extract_temp(install_progress)
+        else:
+            try:
+                self.local_file.extract_archive(archive, install_progress)
+            except Exception:
+                ArchiveCache().discard(key)
+                raise
+        self.local_file.record_install(self.sum_control, self.remote_timestamp)
+
+    def submit(self, http_client, priority=PRIORITY_NORMAL, download_progress=None, install_progress=None,
+               on_install=None):
+        # returns a cancellable future on the transport chosen in settings
+        if selected_transport() == TRANSPORT_ASYNCIO:
+            return AsyncTransport().install(self, http_client, priority, download_progress, install_progress,
+                                            on_install)
+        return TaskScheduler().submit(
+            partial(self.install, http_client, download_progress, install_progress, on_install),
+            priority=priority, key=('download', self.key)
+        )
+
+
+# manifest fetch, download, verify and install without kivy, used by
+# python -m app sync to stage rigs from a script
+class SyncEngine:
+
+    def __init__(self, jobs=None):
+        workers_num = jobs or ConfigService().snapshot.getint('generic', 'workers')
+        self.scheduler = TaskScheduler(workers_num=workers_num)
+        self.scheduler.set_workers_num(workers_num)
+        ClientRegistry().resize_pool(self.scheduler.workers_num)
+        self.http_client = ClientRegistry().http_client
+
+    def manifest(self, leagues=None, game=None):
+        jobs = []
+        for skin in self.http_client.list_skins():
+            skin_type = skin_type_of(skin)
+            if skin_type is None or (game is not None and skin_type != game):
+                continue
+            league_id = "{}".format(skin['league_id'])
+            if leagues and league_id not in leagues:
+                continue
+            jobs.append(SkinJob(league_id, skin, skin_type))
+        return jobs
+
+    def sync(self, leagues=None, game=None, force=False, on_done=None):
+        # force reinstalls skins that are already up to date (recreate)
+        started = time.monotonic()
+        summary = {
+            'server': self.http_client.server,
+            'skins': 0,
+            'installed': [],
+            'up_to_date': [],
+            'missing_car': [],
+            'failed': [],
+        }
+        tasks = {}
+        for job in self.manifest(leagues, game):
+            summary['skins'] += 1
+            state = job.state()
+            if state == STATE_MISSING:
+                summary['missing_car'].append(job.skin_name)
+            elif state == STATE_RECREATE and not force:
+                summary['up_to_date'].append(job.skin_name)
+            else:
+                task = job.submit(self.http_client)
+                # the same skin listed by several leagues is merged into one task
+                tasks.setdefault(task, []).append(job)
+
+        for task in as_completed(tasks):
+            exc = task.exception()
+            for job in tasks[task]:
+                if exc is None:
+                    summary['installed'].append(job.skin_name)
+                else:
+                    summary['failed'].append({'skin': job.skin_name, 'error': str(exc)})
+                if on_done is not None:
+                    on_done(job, exc)
+        summary['seconds'] = round(time.monotonic() - started, 3)
+        return summary
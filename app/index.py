@@ -0,0 +1,229 @@
+import os
+import sys
+import threading
+import select
+import ctypes
+import ctypes.util
+
+from .threads import Singleton
+from .config import ConfigService
+
+
+def _key(name):
+    # windows paths are case insensitive, manifest names do not always match
+    return os.path.normcase(name)
+
+
+def _scan_dirs(path):
+    result = {}
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir():
+                    result[_key(entry.name)] = entry.stat().st_mtime
+    except OSError:
+        pass
+    return result
+
+
+def _scan_files(path, suffix):
+    result = set()
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.lower().endswith(suffix):
+                    result.add(_key(entry.name[:-len(suffix)]))
+    except OSError:
+        pass
+    return result
+
+
+class InotifyWatcher:
+    # linux only, wakes the index up as soon as something changes
+
+    _IN_MODIFY = 0x00000002
+    _IN_ATTRIB = 0x00000004
+    _IN_MOVED_FROM = 0x00000040
+    _IN_MOVED_TO = 0x00000080
+    _IN_CREATE = 0x00000100
+    _IN_DELETE = 0x00000200
+    _IN_DELETE_SELF = 0x00000400
+    _IN_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+        self.wake_fd, self.wake_write_fd = os.pipe()
+        self.watches = {}
+
+    @classmethod
+    def available(cls):
+        return sys.platform.startswith('linux') and ctypes.util.find_library('c') is not None
+
+    def watch(self, paths):
+        paths = set(paths)
+        for path in set(self.watches) - paths:
+            self.libc.inotify_rm_watch(self.fd, self.watches.pop(path))
+        for path in paths - set(self.watches):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self._IN_MASK)
+            if wd >= 0:
+                self.watches[path] = wd
+
+    def wake(self):
+        # ends a wait() in progress from another thread
+        os.write(self.wake_write_fd, b'\0')
+
+    def wait(self, timeout, settle=0.5):
+        # True when something changed before the timeout or wake() was
+        # called, bursts of events (e.g. an archive being extracted) are
+        # drained until it settles
+        readable, _, _ = select.select([self.fd, self.wake_fd], [], [], timeout)
+        if not readable:
+            return False
+        if self.wake_fd in readable:
+            os.read(self.wake_fd, 64)
+            if self.fd not in readable:
+                return True
+        while readable:
+            os.read(self.fd, 65536)
+            readable, _, _ = select.select([self.fd], [], [], settle)
+        return True
+
+
+# one scandir pass over the AC content/cars and ACC Customs trees, every
+# skin model queries this instead of stat'ing its own paths; the tree is
+# watched with inotify on linux and polled everywhere else
+class InstalledIndex(metaclass=Singleton):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.listeners = []
+        self.ac_cars = {}
+        self.ac_skins = {}
+        self.acc_cars = set()
+        self.acc_skins = {}
+        self.rescan_event = threading.Event()
+        self.watcher = None
+        self.thread = None
+        self.rescan()
+        # a changed skins directory means a different tree
+        ConfigService().subscribe(self.on_config_changed, sections=('ac', 'acc'))
+
+    def on_config_changed(self, config):
+        if self.thread is None:
+            self.rescan()
+        else:
+            # the watch thread rescans and watches the new directories
+            self.request_rescan()
+
+    def bind(self, callback):
+        self.listeners.append(callback)
+
+    def start(self):
+        if self.thread is not None:
+            return
+        if InotifyWatcher.available():
+            try:
+                self.watcher = InotifyWatcher()
+            except OSError as exc:
+                print(exc)
+        self.thread = threading.Thread(target=self.watch, daemon=True)
+        self.thread.start()
+
+    def request_rescan(self):
+        self.rescan_event.set()
+        if self.watcher is not None:
+            self.watcher.wake()
+
+    def watched_paths(self):
+        paths = []
+        config = ConfigService().snapshot
+        ac_dir = config.get('ac', 'skins_dir')
+        if ac_dir:
+            paths.append(ac_dir)
+            paths.extend(os.path.join(ac_dir, car, 'skins') for car in self.ac_cars.values())
+        acc_dir = config.get('acc', 'skins_dir')
+        if acc_dir:
+            paths.append(os.path.join(acc_dir, 'Customs', 'Cars'))
+            paths.append(os.path.join(acc_dir, 'Customs', 'Liveries'))
+        return [path for path in paths if os.path.isdir(path)]
+
+    def watch(self):
+        while True:
+            interval = ConfigService().snapshot.getfloat('generic', 'fs_poll_interval', 5.0)
+            if self.watcher is not None:
+                self.watcher.watch(self.watched_paths())
+                self.watcher.wait(interval)
+            else:
+                self.rescan_event.wait(interval)
+            self.rescan_event.clear()
+            try:
+                self.rescan()
+            except Exception as exc:
+                print(exc)
+
+    def rescan(self):
+        ac_cars = {}
+        ac_skins = {}
+        config = ConfigService().snapshot
+        ac_dir = config.get('ac', 'skins_dir')
+        if ac_dir:
+            try:
+                with os.scandir(ac_dir) as it:
+                    for entry in it:
+                        if not entry.is_dir():
+                            continue
+                        car = _key(entry.name)
+                        ac_cars[car] = entry.name
+                        for skin, mtime in _scan_dirs(os.path.join(entry.path, 'skins')).items():
+                            ac_skins[(car, skin)] = mtime
+            except OSError:
+                pass
+
+        acc_cars = set()
+        acc_skins = {}
+        acc_dir = config.get('acc', 'skins_dir')
+        if acc_dir:
+            acc_cars = _scan_files(os.path.join(acc_dir, 'Customs', 'Cars'), '.json')
+            acc_skins = _scan_dirs(os.path.join(acc_dir, 'Customs', 'Liveries'))
+
+        with self.lock:
+            changed = (ac_cars != self.ac_cars or ac_skins != self.ac_skins
+                       or acc_cars != self.acc_cars or acc_skins != self.acc_skins)
+            self.ac_cars = ac_cars
+            self.ac_skins = ac_skins
+            self.acc_cars = acc_cars
+            self.acc_skins = acc_skins
+
+        if changed:
+            for listener in self.listeners:
+                listener()
+
+    def car_exists(self, skin_type, car_name, skin_name):
+        if skin_type == 'ac':
+            return _key(car_name) in self.ac_cars
+        return _key(skin_name) in self.acc_cars
+
+    def skin_mtime(self, skin_type, car_name, skin_name):
+        if skin_type == 'ac':
+            return self.ac_skins.get((_key(car_name), _key(skin_name)))
+        return self.acc_skins.get(_key(skin_name))
+
+    def update_skin(self, skin_type, car_name, skin_name, mtime):
+        # installs done by this app update the index right away
+        with self.lock:
+            if skin_type == 'ac':
+                self.ac_cars.setdefault(_key(car_name), car_name)
+                self.ac_skins[(_key(car_name), _key(skin_name))] = mtime
+            else:
+                self.acc_cars.add(_key(skin_name))
+                self.acc_skins[_key(skin_name)] = mtime
+
+    def remove_skin(self, skin_type, car_name, skin_name):
+        with self.lock:
+            if skin_type == 'ac':
+                self.ac_skins.pop((_key(car_name), _key(skin_name)), None)
+            else:
+                self.acc_skins.pop(_key(skin_name), None)
@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import bisect
+import functools
+import logging
+import threading
+
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .threads import Singleton
+from .config import ConfigService
+
+
+# upper bounds of the duration histograms in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{{{}}}".format(",".join('{}="{}"'.format(
+        name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in pairs))
+
+
+class Histogram:
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = Metrics().prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# in-process counters, gauges and span durations; every finished span is
+# also written as one JSON line to a rotating events file, the totals are
+# exported in the Prometheus text format to a file (node_exporter textfile
+# collector) and/or served on http://<rig>:<port>/metrics
+class Metrics(metaclass=Singleton):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.collectors = []
+        self.logger = logging.getLogger('simrace.metrics')
+        self.logger.propagate = False
+        self.handler = None
+        self.events_path = None
+        self.prometheus_path = ""
+        self.prometheus_port = 0
+        self.server = None
+        self.export_interval = 15
+        self.exporter = None
+        self.stop_event = threading.Event()
+        if ConfigService().current is not None:
+            self.set_config(ConfigService().snapshot)
+        ConfigService().subscribe(self.set_config, sections=('metrics',))
+
+    def set_config(self, config):
+        events_path = config.get('metrics', 'events_file', '')
+        if events_path != self.events_path:
+            self.open_events(events_path, config.getint('metrics', 'events_max_mb', 10),
+                             config.getint('metrics', 'events_backups', 3))
+        self.export_interval = max(config.getint('metrics', 'export_interval', 15), 1)
+        self.prometheus_path = config.get('metrics', 'prometheus_file', '')
+        port = config.getint('metrics', 'prometheus_port', 0)
+        if port != self.prometheus_port:
+            self.serve(port)
+        if self.prometheus_path and self.exporter is None:
+            self.exporter = threading.Thread(target=self.export_loop, daemon=True)
+            self.exporter.start()
+
+    def open_events(self, path, max_mb, backups):
+        if self.handler is not None:
+            self.logger.removeHandler(self.handler)
+            self.handler.close()
+            self.handler = None
+        self.events_path = path
+        if not path:
+            return
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self.handler = RotatingFileHandler(path, maxBytes=max_mb * 1024 * 1024, backupCount=backups,
+                                               encoding='utf-8', delay=True)
+        except OSError as exc:
+            print(exc)
+            return
+        self.handler.setFormatter(logging.Formatter('%(message)s'))
+        self.logger.addHandler(self.handler)
+        self.logger.setLevel(logging.INFO)
+
+    def serve(self, port):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        self.prometheus_port = port
+        if not port:
+            return
+        try:
+            self.server = ThreadingHTTPServer(('', port), MetricsHandler)
+        except OSError as exc:
+            print(exc)
+            return
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def export_loop(self):
+        while not self.stop_event.wait(self.export_interval):
+            if not self.prometheus_path:
+                self.exporter = None
+                return
+            self.export()
+
+    def export(self):
+        # atomic, a collector never reads a half written file
+        if not self.prometheus_path:
+            return
+        temp_path = "{}.tmp".format(self.prometheus_path)
+        try:
+            os.makedirs(os.path.dirname(self.prometheus_path) or '.', exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(self.prometheus_text())
+            os.replace(temp_path, self.prometheus_path)
+        except OSError as exc:
+            print(exc)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self.lock:
+            self.gauges[(name, label_key(labels))] = value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def add_collector(self, collector):
+        # called on export, returns {gauge name: value} sampled right then
+        self.collectors.append(collector)
+
+    def event(self, kind, **fields):
+        if self.handler is None:
+            return
+        fields['ts'] = round(time.time(), 3)
+        fields['event'] = kind
+        try:
+            self.logger.info(json.dumps(fields, default=str))
+        except Exception as exc:
+            print(exc)
+
+    @contextmanager
+    def span(self, name, **labels):
+        # times the block as <name>_seconds, failures count as
+        # <name>_failures_total and a 'bytes' field of the yielded dict
+        # as <name>_bytes_total; the dict is added to the event
+        fields = {}
+        started = time.perf_counter()
+        try:
+            yield fields
+        except BaseException as exc:
+            self.inc('{}_failures_total'.format(name), **labels)
+            self.end_span(name, started, labels, fields, error=str(exc) or type(exc).__name__)
+            raise
+        self.end_span(name, started, labels, fields)
+
+    def end_span(self, name, started, labels, fields, **extra):
+        seconds = time.perf_counter() - started
+        self.observe('{}_seconds'.format(name), seconds, **labels)
+        if fields.get('bytes'):
+            self.inc('{}_bytes_total'.format(name), fields['bytes'], **labels)
+        fields.update(extra)
+        self.event('span', span=name, seconds=round(seconds, 6), labels=labels, **fields)
+
+    def prometheus_text(self):
+        gauges = {}
+        for collector in list(self.collectors):
+            try:
+                for name, value in collector().items():
+                    gauges[(name, ())] = value
+            except Exception as exc:
+                print(exc)
+        with self.lock:
+            counters = dict(self.counters)
+            gauges.update(self.gauges)
+            histograms = {key: (list(h.counts), h.count, h.sum) for key, h in self.histograms.items()}
+
+        lines = []
+
+        def family(items, kind):
+            last = None
+            for (name, key), value in sorted(items.items()):
+                metric = "simrace_{}".format(name)
+                if name != last:
+                    lines.append("# TYPE {} {}".format(metric, kind))
+                    last = name
+                yield metric, key, value
+
+        for metric, key, value in family(counters, 'counter'):
+            lines.append("{}{} {}".format(metric, format_labels(key), value))
+        for metric, key, value in family(gauges, 'gauge'):
+            lines.append("{}{} {}".format(metric, format_labels(key), value))
+        for metric, key, (counts, count, total) in family(histograms, 'histogram'):
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS + ('+Inf',), counts):
+                cumulative += bucket
+                lines.append("{}_bucket{} {}".format(metric, format_labels(key, (('le', str(bound)),)), cumulative))
+            lines.append("{}_sum{} {}".format(metric, format_labels(key), round(total, 6)))
+            lines.append("{}_count{} {}".format(metric, format_labels(key), count))
+        return "\n".join(lines) + "\n"
+
+
+def traced(name, **labels):
+    # decorator, the whole call is one span
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with Metrics().span(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,173 @@
+from functools import partial
+
+from kivy.clock import mainthread, Clock
+from kivy.event import EventDispatcher
+from kivy.properties import StringProperty, NumericProperty, BooleanProperty
+from kivy.utils import get_color_from_hex
+from kivymd.app import MDApp
+from kivymd.uix.snackbar import Snackbar
+
+from app.clients import ClientRegistry
+from app.threads import TaskScheduler, PRIORITY_HIGH, PRIORITY_LOW
+from app.progress import ProgressAggregator
+from app.engine import SkinJob, STATE_DOWNLOAD, STATE_UPDATE
+
+
+# download task -> models that submitted it, the scheduler hands the same
+# task to every league listing the skin
+_task_holders = {}
+
+
+# download state and progress of a single skin, it lives as long as the
+# skin is in the manifest - widgets in the recycled list only bind to it
+# while they display it
+class SkinModel(EventDispatcher):
+
+    state = StringProperty(STATE_DOWNLOAD)
+    progress = NumericProperty(0)
+    download_in_progress = BooleanProperty(False)
+    installing = BooleanProperty(False)
+
+    def __init__(self, skin_id, league_id, skin, skin_type, **kwargs):
+        super(SkinModel, self).__init__(**kwargs)
+        self.app = MDApp.get_running_app()
+
+        self.skin_id = skin_id
+        self.skin = skin
+        # TODO: do refactoring of fields, it's a mess now
+        self.job = SkinJob(league_id, skin, skin_type)
+        self.league_id = league_id
+        self.skin_type = skin_type
+        self.league_color = skin.get('league_color_rgb')
+
+        # new fields
+        self.driver_name = skin.get('driver_name', '')
+        self.team_name = skin.get('team_name', '')
+        self.league_name = skin.get('league_name', '')
+        self.league_type = skin.get('league_type', 'single')
+        self.car_name_ext = skin.get('car_name', '')
+        self.car_class = skin.get('car_class', '')
+        self.car_year = str(skin.get('car_year', ''))
+        self.car_number = str(skin.get('number', ''))
+
+        self.pool = TaskScheduler()
+        self.aggregator = ProgressAggregator()
+        self.dispatcher = self.app.custom_dispatcher
+
+        self.http_client = ClientRegistry().http_client
+
+        self.temp_size = 0
+        self.download_task = None
+        self.register_events()
+        Clock.schedule_once(self.refresh_state)
+
+    @property
+    def record(self):
+        # plain data the recycled row needs to draw itself
+        if self.league_type == 'swap':
+            driver_name, team_name = self.team_name, ""
+        else:
+            driver_name, team_name = self.driver_name, self.team_name
+        return {
+            'skin_id': self.skin_id,
+            'league_color': self.league_color,
+            'car_number': self.car_number,
+            'car_model': self.car_name_ext,
+            'driver_name': driver_name,
+            'team_name': team_name,
+        }
+
+    def on_refresh(self, *args):
+        Clock.schedule_once(self.refresh_state)
+
+    @mainthread
+    def refresh_state(self, dt):
+        self.state = self.job.state()
+
+    def register_events(self):
+        # bulk actions are driven by ContentScreen, which knows the leagues
+        self.dispatcher.bind(on_refresh=self.on_refresh)
+
+    def unregister_events(self):
+        self.dispatcher.unbind(on_refresh=self.on_refresh)
+        task, self.download_task = self.download_task, None
+        if task is None:
+            return
+        holders = _task_holders.get(task, set())
+        holders.discard(self)
+        if not holders:
+            # nobody else waits for it, e.g. the same skin in another league
+            _task_holders.pop(task, None)
+            task.cancel()
+
+    def on_recreate_all(self, *args):
+        self.download_start(priority=PRIORITY_LOW)
+
+    def on_download_all(self, *args):
+        if self.state in (STATE_DOWNLOAD, STATE_UPDATE):
+            self.download_start(priority=PRIORITY_LOW)
+
+    def download_start(self, *args, priority=PRIORITY_HIGH):
+        if self.download_task is not None and not self.download_task.done():
+            if not getattr(self.download_task, 'started', True):
+                # still queued - a click moves it ahead of bulk downloads,
+                # asyncio downloads are never queued
+                self.pool.submit(self.download_task.fn, priority=priority, key=self.download_task.key)
+            return
+        self.progress = 0
+        self.download_in_progress = True
+        self.temp_size = 0
+        self.aggregator.start(self, self.update_progress)
+
+        self.download_task = self.job.submit(
+            self.http_client, priority, self.download_progress, self.install_progress,
+            on_install=lambda: Clock.schedule_once(self.start_install)
+        )
+        _task_holders.setdefault(self.download_task, set()).add(self)
+        self.download_task.add_done_callback(self.download_done)
+
+    def download_done(self, task):
+        _task_holders.pop(task, None)
+        self.aggregator.finish(self)
+        if not task.cancelled() and task.exception() is not None:
+            Clock.schedule_once(partial(self.report_error, task.exception()))
+        Clock.schedule_once(self.finish_download)
+
+    def finish_download(self, dt):
+        self.installing = False
+        self.download_in_progress = False
+        self.refresh_state(dt)
+
+    def report_error(self, exc, dt):
+        Snackbar(
+            text="[color=#f2776d]ERROR: {}[/color]".format(exc),
+            size_hint_x=1,
+            snackbar_y="30dp",
+            snackbar_x="30dp",
+            bg_color=get_color_from_hex("#544746")
+        ).open()
+
+    def download_progress(self, max_size, chunk_size):
+        # called from the worker thread, the aggregator publishes it once per frame
+        self.temp_size += chunk_size
+        self.aggregator.update(self, self.temp_size, max_size)
+
+    def update_progress(self, done, total):
+        if not self.download_in_progress or self.installing:
+            return
+        self.progress = min(int(done * 100 / total), 100) if total else 0
+
+    def start_install(self, dt):
+        if not self.download_in_progress:
+            return
+        self.installing = True
+        self.progress = 0
+
+    def install_progress(self, done, total):
+        # called from the extraction thread once per finished member
+        Clock.schedule_once(partial(self.update_install_progress, done, total))
+
+    def update_install_progress(self, done, total, dt):
+        if not self.installing:
+            return
+        self.progress = min(int(done * 100 / total), 100) if total else 100
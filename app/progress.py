@@ -0,0 +1,95 @@
+import time
+
+from collections import deque
+
+from kivy.clock import Clock
+
+from .threads import Singleton
+
+
+class ProgressEntry:
+
+    __slots__ = ('callback', 'done', 'total', 'published', 'finished')
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.done = 0
+        self.total = 0
+        self.published = None
+        self.finished = False
+
+
+# worker threads only store plain integers on their entry (atomic under
+# the GIL, no locks needed), the main loop publishes at most one update
+# per tracked download each frame and the aggregate for bulk operations
+class ProgressAggregator(metaclass=Singleton):
+
+    _THROUGHPUT_WINDOW = 2.0
+
+    def __init__(self):
+        self.entries = {}
+        self.listeners = []
+        self.samples = deque()
+        self.batch_done = 0
+        self.batch_total = 0
+        self.event = None
+
+    def bind(self, callback):
+        self.listeners.append(callback)
+
+    def unbind(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def start(self, key, callback):
+        # main thread only
+        self.entries[key] = ProgressEntry(callback)
+        if self.event is None:
+            self.samples.clear()
+            self.event = Clock.schedule_interval(self.publish, 0)
+
+    def update(self, key, done, total):
+        # safe to call from any thread
+        entry = self.entries.get(key)
+        if entry is not None:
+            entry.done = done
+            entry.total = total
+
+    def finish(self, key):
+        # safe to call from any thread
+        entry = self.entries.get(key)
+        if entry is not None:
+            entry.finished = True
+
+    def publish(self, dt):
+        done = self.batch_done
+        total = self.batch_total
+        for key, entry in list(self.entries.items()):
+            state = (entry.done, entry.total)
+            if state != entry.published:
+                entry.published = state
+                entry.callback(*state)
+            if entry.finished:
+                del self.entries[key]
+                self.batch_done += entry.done
+                self.batch_total += max(entry.total, entry.done)
+            done += entry.done
+            total += max(entry.total, entry.done)
+
+        now = time.monotonic()
+        self.samples.append((now, done))
+        while now - self.samples[0][0] > self._THROUGHPUT_WINDOW:
+            self.samples.popleft()
+        first_time, first_done = self.samples[0]
+        throughput = (done - first_done) / (now - first_time) if now > first_time else 0.0
+
+        percent = int(done * 100 / total) if total else 0
+        for listener in self.listeners:
+            listener(percent, throughput, len(self.entries))
+
+        if not self.entries:
+            # batch finished - stop ticking until the next download starts
+            self.batch_done = 0
+            self.batch_total = 0
+            self.event.cancel()
+            self.event = None
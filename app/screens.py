@@ -1,11 +1,12 @@
 import os
 import shutil
 import json
+import threading
 
 from pathlib import Path
+from datetime import datetime
 
 from functools import partial
-from zipfile import ZipFile, ZIP_DEFLATED
 
 from kivymd.uix.screen import MDScreen
 from kivymd.uix.dialog import MDDialog
@@ -19,24 +20,36 @@ from kivy.uix.screenmanager import ScreenManager, FadeTransition,\
 from kivymd.uix.snackbar import Snackbar
 from kivy.utils import get_color_from_hex
 
-from .widgets import SkinWidget, LeagueButtonWidget
-from .clients import HTTPClient
+from .widgets import LeagueButtonWidget
+from .models import SkinModel
+from .engine import skin_type_of
+from .config import ConfigService
+from .clients import ClientRegistry, ManifestUnavailable
+from .threads import TaskScheduler, PRIORITY_HIGH
+from .progress import ProgressAggregator
+from .index import InstalledIndex
+from .ziputil import pack
+from .diff import diff_manifest, apply_ops
+from .backup import BackupStore, BackupCancelled, CUSTOMS_ROOTS
 
 
 class MainScreen(ScreenManager):
 
     def __init__(self, *args, **kwargs):
         self.app = MDApp.get_running_app()
-        self.http_client = HTTPClient()
+        self.http_client = ClientRegistry().http_client
         super(MainScreen, self).__init__(*args, **kwargs)
         self.transition = FadeTransition()
         self._register_screens()
         self.app.custom_dispatcher.bind(on_refresh=self.on_refresh)
 
     def on_refresh(self, *args):
+        if self.content.league_manifest and self.http_client.cached_skins() is not None:
+            # content is up, the new manifest is diffed against it
+            self.content.revalidate()
+            return
         for screen in self.content.ids.content_manager.screens:
-            # TODO: very hacky - fix me
-            screen.children[0].children[0].children[0].clear_widgets()
+            screen.clear()
         self.loader.switch_screen()
 
     def _register_screens(self):
@@ -45,6 +58,7 @@ class MainScreen(ScreenManager):
         self.backup = BackupScreen(name='backup')
         self.backup.create_backup(skip_dialog=True)
         self.zip_skin = ZipSkinScreen(name='zip_skin')
+        InstalledIndex().start()
 
         self.app.custom_dispatcher.bind(on_initialize=self.content.on_initialize)
 
@@ -73,34 +87,82 @@ class LoaderScreen(MDScreen):
         self.loader_label.text = "Loading..."
 
     def load(self, *args):
-        self.loader_label.text = "Trying to connect to: {}...".format(self.manager.http_client.server)
-        try:
-            self.manager.http_client.ping()
-        except Exception as exc:
-            self.loader_label.text = "Unable to connect to: {}\n{}\n\nCheck your config by pressing F1 and retry.".format(self.manager.http_client.server, exc)
-        else:
-            self.loader_label.text = "Successfully connected to: {}...".format(self.manager.http_client.server)
-            Clock.schedule_once(self.initialize_content)
+        http_client = self.manager.http_client
+        skins = http_client.cached_skins()
+        if skins:
+            # last known manifest right away, the server is asked in the background
+            self.initialize_content(skins)
+            self.manager.content.revalidate()
+            return
+        self.loader_label.text = "Trying to connect to: {}...".format(http_client.server)
+        task = TaskScheduler().submit(http_client.fetch_skins, priority=PRIORITY_HIGH, key='fetch_skins')
+        task.add_done_callback(lambda task: Clock.schedule_once(partial(self.loaded, task)))
+
+    def loaded(self, task, dt):
+        if task.cancelled():
+            return
+        server = self.manager.http_client.server
+        if task.exception() is not None:
+            self.loader_label.text = "Unable to connect to: {}\n{}\n\nCheck your config by pressing F1 and retry.".format(server, task.exception())
+            return
+        self.loader_label.text = "Successfully connected to: {}...".format(server)
+        self.manager.content.set_manifest_status("")
+        self.initialize_content(task.result())
 
-    def initialize_content(self, *args):
+    def initialize_content(self, skins):
         self.loader_label.text += "\n\nInitializing content..."
-        self.manager.app.custom_dispatcher.do_initialize()
+        self.manager.app.custom_dispatcher.do_initialize(skins)
 
 
 class ContentScreen(MDScreen):
 
-    _ACC_ID = 1
-    _AC_ID = 2
+    _PREFETCH_BATCH = 10
+    # seconds between manifest retries while the server is unreachable
+    _REVALIDATE_RETRY = 60
 
     def __init__(self, *args, **kwargs):
         self.league_skins = {}
+        self.league_manifest = {}
+        self.loaded_leagues = set()
+        self.prefetch_event = None
+        self.revalidate_task = None
+        self.revalidate_event = None
         self.skins = {}
         super(ContentScreen, self).__init__(*args, **kwargs)
+        self.app = MDApp.get_running_app()
+        self.app.custom_dispatcher.bind(on_download_all=self.on_download_all)
+        self.app.custom_dispatcher.bind(on_recreate_all=self.on_recreate_all)
+        ProgressAggregator().bind(self.update_bulk_progress)
+        InstalledIndex().bind(self.on_index_changed)
+
+    def on_index_changed(self):
+        # called from the watcher thread
+        Clock.schedule_once(self.refresh_loaded)
+
+    def refresh_loaded(self, dt):
+        for model in self.skins.values():
+            model.refresh_state(dt)
+
+    def update_bulk_progress(self, percent, throughput, active):
+        if not active:
+            self.ids.bulk_progress_label.text = ""
+            return
+        self.ids.bulk_progress_label.text = "{} left - {}% - {:.1f} MB/s".format(
+            active, percent, throughput / (1024 * 1024)
+        )
 
-    def on_initialize(self, obj):
-        left_skins = list(self.skins.keys())
+    def on_initialize(self, obj, skins):
+        # only the manifest is sorted into leagues here, skin models and rows
+        # are built when a league is activated or prefetched
+        self.loaded_leagues = set()
+        self.sort_manifest(skins)
+        self.activate_league(self.ids.content_manager.current)
+        self.switch_screen()
+
+    def sort_manifest(self, skins):
+        self.league_manifest = {}
         active = True
-        for skin in self.manager.http_client.list_skins():
+        for skin in skins:
             league_id = "{}".format(skin['league_id'])
             if not league_id in self.league_skins:
                 self.manager.content.ids.leagues_buttons.add_widget(
@@ -112,42 +174,153 @@ class ContentScreen(MDScreen):
                 self.league_skins[league_id] = True
                 active = False
 
-            try:
-                league_screen = self.manager.content.ids.content_manager.get_screen(league_id)
-            except ScreenManagerException:
-                # TODO: log errors here
+            skin_type = skin_type_of(skin)
+            if skin_type is None:
                 continue
 
-            # TODO: very hacky - fix me
-            league_view = league_screen.children[0].children[0].children[0]
-
             skin_id = "{}_{}_{}_{}".format(skin["game_id"], skin["league_id"], skin["car_name"], skin["skin_name"])
-            if skin_id in left_skins:
-                left_skins.remove(skin_id)
-
-            game_id = int(skin['game_id'])
-            skin_type = ""
-            if game_id == self._ACC_ID:
-                skin_type = 'acc'
-            elif game_id == self._AC_ID:
-                skin_type = 'ac'
-            else:
+            self.league_manifest.setdefault(league_id, []).append((skin_id, skin, skin_type))
+
+        manifest = {skin_id: skin for skins in self.league_manifest.values() for skin_id, skin, _ in skins}
+        for skin_id in list(self.skins.keys()):
+            if manifest.get(skin_id) != self.skins[skin_id].skin:
+                # gone from the manifest or changed on the server (new sum
+                # or timestamp), a changed skin gets a fresh model
+                model = self.skins.pop(skin_id)
+                model.unregister_events()
+                del model
+
+    def update_manifest(self, skins):
+        # a refresh against the last manifest: only the rows added, removed,
+        # changed or moved are touched, leagues never opened stay lazy
+        previous = self.league_manifest
+        self.sort_manifest(skins)
+        for league_id, ops in diff_manifest(previous, self.league_manifest).items():
+            if league_id not in self.loaded_leagues:
                 continue
+            try:
+                league_screen = self.ids.content_manager.get_screen(league_id)
+            except ScreenManagerException:
+                continue
+            league_screen.apply_ops(ops, [skin_id for skin_id, _, _ in previous.get(league_id, [])],
+                                    partial(self.record_of, league_id))
+        # restarts a prefetch that was still walking the old manifest
+        self.activate_league(self.ids.content_manager.current)
+
+    def record_of(self, league_id, entry):
+        skin_id, skin, skin_type = entry
+        model = self.skins.get(skin_id)
+        if model is None:
+            model = SkinModel(skin_id, league_id, skin, skin_type)
+            self.skins[skin_id] = model
+        return model.record
+
+    def revalidate(self, *args):
+        if self.revalidate_event is not None:
+            self.revalidate_event.cancel()
+            self.revalidate_event = None
+        if self.revalidate_task is not None and not self.revalidate_task.done():
+            return
+        self.set_manifest_status("Checking for updates...")
+        self.revalidate_task = TaskScheduler().submit(
+            self.manager.http_client.fetch_skins, priority=PRIORITY_HIGH, key='fetch_skins'
+        )
+        self.revalidate_task.add_done_callback(
+            lambda task: Clock.schedule_once(partial(self.revalidated, task))
+        )
 
-            widget = self.skins.get(skin_id)
-            if widget is None:
-                widget = SkinWidget(league_id, skin, skin_type)
-                self.skins[skin_id] = widget
-            else:
-                widget.remote_timestamp = skin['timestamp']
-            league_view.add_widget(widget)
+    def revalidated(self, task, dt):
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is None:
+            self.set_manifest_status("")
+            self.update_manifest(task.result())
+            return
+        fetched = self.manager.http_client.manifest.fetched
+        since = " from {}".format(datetime.fromtimestamp(fetched).strftime("%Y-%m-%d %H:%M")) if fetched else ""
+        if isinstance(exc, ManifestUnavailable):
+            text = "STALE - {}, showing skins{}".format(exc, since)
+        else:
+            text = "OFFLINE - {} is unreachable, showing skins{}".format(self.manager.http_client.server, since)
+        self.set_manifest_status(text, "#f2776d")
+        # keep trying quietly, the indicator goes away once the server answers
+        self.revalidate_event = Clock.schedule_once(self.revalidate, self._REVALIDATE_RETRY)
+
+    def set_manifest_status(self, text, color="#B3B6B8"):
+        self.ids.manifest_status_label.text = text
+        self.ids.manifest_status_label.text_color = get_color_from_hex(color)
+
+    def activate_league(self, league_id):
+        if league_id not in self.loaded_leagues:
+            self.load_league(league_id)
+        if self.prefetch_event is not None:
+            self.prefetch_event.cancel()
+            self.prefetch_event = None
+        if ConfigService().snapshot.getboolean('generic', 'prefetch_leagues', False):
+            self.prefetch_event = Clock.schedule_once(partial(self.prefetch_league, self.next_league(league_id)))
+
+    def next_league(self, league_id):
+        leagues = list(self.league_manifest.keys())
+        if league_id not in leagues:
+            return None
+        return leagues[(leagues.index(league_id) + 1) % len(leagues)]
+
+    def load_league(self, league_id):
+        for _ in self.build_league(league_id):
+            pass
+
+    def build_league(self, league_id):
+        # generator, yields after every model so prefetch can spread it over frames
+        records = []
+        for skin_id, skin, skin_type in self.league_manifest.get(league_id, []):
+            model = self.skins.get(skin_id)
+            if model is None:
+                model = SkinModel(skin_id, league_id, skin, skin_type)
+                self.skins[skin_id] = model
+                yield
+            records.append(model.record)
 
-        for skin in left_skins:
-            widget = self.skins.pop(skin)
-            widget.unregister_events()
-            del widget
+        try:
+            league_screen = self.manager.content.ids.content_manager.get_screen(league_id)
+        except ScreenManagerException:
+            # TODO: log errors here
+            return
+        league_screen.set_records(records)
+        self.loaded_leagues.add(league_id)
 
-        self.switch_screen()
+    def prefetch_league(self, league_id, dt, builder=None):
+        # fill the next league a few skins per frame while the user looks at this one
+        if league_id is None or league_id in self.loaded_leagues:
+            self.prefetch_event = None
+            return
+        if builder is None:
+            builder = self.build_league(league_id)
+        for _ in range(self._PREFETCH_BATCH):
+            try:
+                next(builder)
+            except StopIteration:
+                self.prefetch_event = None
+                return
+        self.prefetch_event = Clock.schedule_once(partial(self.prefetch_league, league_id, builder=builder))
+
+    def load_all_leagues(self):
+        for league_id in self.league_manifest:
+            if league_id not in self.loaded_leagues:
+                self.load_league(league_id)
+
+    def on_download_all(self, *args):
+        current_league_id = self.ids.content_manager.current
+        for skin_id, _, _ in self.league_manifest.get(current_league_id, []):
+            model = self.skins.get(skin_id)
+            if model is not None:
+                model.on_download_all()
+
+    def on_recreate_all(self, *args):
+        # recreate covers every league, not only the ones opened so far
+        self.load_all_leagues()
+        for model in list(self.skins.values()):
+            model.on_recreate_all()
 
     def switch_screen(self):
         self.manager.current = self.name
@@ -155,13 +328,16 @@ class ContentScreen(MDScreen):
 
 class SettingsScreen(MDScreen):
 
-    __config__ = ('generic_user', 'generic_password', 'generic_server', 'ac_skins_dir', 'acc_skins_dir')
+    __config__ = ('generic_user', 'generic_password', 'generic_server', 'generic_workers', 'generic_max_bandwidth',
+                  'generic_max_connections_per_host', 'generic_transport', 'generic_async_concurrency',
+                  'ac_skins_dir', 'acc_skins_dir', 'metrics_prometheus_file', 'metrics_prometheus_port')
 
     def __init__(self, *args, **kwargs):
         super(SettingsScreen, self).__init__(*args, **kwargs)
         self.app = MDApp.get_running_app()
         self.config = self.app.config
         self.set_current_settings()
+        ConfigService().subscribe(self.apply_workers, sections=('generic',))
 
     def set_current_settings(self):
         for attr in self.__config__:
@@ -184,9 +360,20 @@ class SettingsScreen(MDScreen):
             except Exception as exc:
                 print(exc)
         self.config.write()
+        # subscribers of the changed sections rebuild themselves
+        ConfigService().publish()
         self.app.close_settings()
         self.app.custom_dispatcher.do_refresh()
 
+    def apply_workers(self, config):
+        try:
+            workers_num = config.getint('generic', 'workers')
+        except ValueError as exc:
+            print(exc)
+            return
+        TaskScheduler().set_workers_num(workers_num)
+        ClientRegistry().resize_pool(TaskScheduler().workers_num)
+
 
 class BackupScreen(MDScreen):
 
@@ -194,13 +381,30 @@ class BackupScreen(MDScreen):
         super(BackupScreen, self).__init__(*args, **kwargs)
         self.app = MDApp.get_running_app()
         self.app.custom_dispatcher.bind(on_open_backup=self.switch_screen)
-        self.config = self.app.config
-        self.set_config()
+        self.set_config(ConfigService().snapshot)
+        ConfigService().subscribe(self.set_config, sections=('backup', 'acc'))
         self.set_current_settings()
         self.create_dialog = None
         self.clean_dialog = None
+        self.restore_dialog = None
+        self.restore_task = None
+        self.backup_task = None
+        self.backup_cancel = None
+        self.backup_progress_event = None
+        self.backup_done_bytes = 0
+        self.backup_total_bytes = 0
         self.ensure_backup_dir()
-        self.backup_exists = os.path.exists("{}/backup.zip".format(self.backup_destination_path)) if True else False
+        self.show_snapshots()
+
+    def show_snapshots(self):
+        snapshots = self.store.snapshots()
+        if not snapshots:
+            self.ids.backup_status.text = ""
+            return
+        latest = datetime.fromtimestamp(self.store.snapshot_time(snapshots[-1]))
+        self.ids.backup_status.text = "{} restore points, latest from {}".format(
+            len(snapshots), latest.strftime("%Y-%m-%d %H:%M")
+        )
 
     def report_error(self, exc, dt):
         Snackbar(
@@ -220,25 +424,29 @@ class BackupScreen(MDScreen):
             bg_color=get_color_from_hex("#e3dede")
         ).open()
 
-    def _refresh_config(func):
-        def wrapper(self, *args, **kwargs):
-            self.set_config()
-            return func(self, *args, **kwargs)
-        return wrapper
-
     def switch_screen(self, *args):
         if self.manager.current != self.name:
             self.manager.current = self.name
 
-    def set_config(self):
-        self.backup_destination_path = self.config.get("backup", "destination_path")
-        self.game_dir = self.config.get("acc", "skins_dir")
+    def set_config(self, config):
+        self.backup_destination_path = config.get("backup", "destination_path")
+        self.game_dir = config.get("acc", "skins_dir")
         self.customs_path = "{}\\Customs".format(self.game_dir)
         self.liveries_path = "{}\\Liveries".format(self.customs_path)
         self.cars_path = "{}\\Cars".format(self.customs_path)
+        self.store = BackupStore(
+            self.backup_destination_path,
+            keep_last=config.getint("backup", "keep_last"),
+            keep_daily=config.getint("backup", "keep_daily"),
+            keep_weekly=config.getint("backup", "keep_weekly"),
+        )
+
+    @property
+    def backup_exists(self):
+        return self.store.exists
 
     def set_current_settings(self):
-        self.ids.backup_label.text = "{}\n{}".format(self.ids.backup_label.text, self.config.get('backup', 'destination_path'))
+        self.ids.backup_label.text = "{}\n{}".format(self.ids.backup_label.text, self.backup_destination_path)
 
     def ensure_backup_dir(self):
         if self.backup_destination_path != "":
@@ -246,32 +454,19 @@ class BackupScreen(MDScreen):
         else:
             raise Exception("Backup destination path is empty!")
 
-    @_refresh_config
     def create_backup(self, skip_dialog=False):
 
         def action_cancel(*args):
             self.create_dialog.dismiss()
 
         def action_confirm(*args):
-            try:
-                with ZipFile('{}\\backup.zip'.format(self.backup_destination_path), 'w') as f:
-                    for root, _, files in os.walk(self.cars_path):
-                        for file in files:
-                            f.write(os.path.join(root, file), 'Customs/Cars/{}'.format(file))
-
-                    for root, _, files in os.walk(self.liveries_path):
-                        for file in files:
-                            f.write(os.path.join(root, file), "Customs/Liveries/{}/{}".format(os.path.basename(root), file))
-                    self.backup_exists = True
-                    self.create_dialog.dismiss()
-                    Clock.schedule_once(partial(self.report_info, "Backup created!"))
-            except Exception as exc:
-                Clock.schedule_once(partial(self.report_error, exc))
+            self.create_dialog.dismiss()
+            self.start_backup()
 
         if not self.create_dialog:
             self.create_dialog = MDDialog(
-                title="Overwrite backup",
-                text="Backup already exist, do you want to overwrite?",
+                title="Update backup",
+                text="Backup already exist, do you want to update it?",
                 buttons=[
                     MDFlatButton(
                         text="Cancel", on_release=action_cancel
@@ -287,20 +482,164 @@ class BackupScreen(MDScreen):
         elif not skip_dialog and self.backup_exists:
             self.create_dialog.open()
 
-    @_refresh_config
+    @property
+    def backup_running(self):
+        return self.backup_task is not None and not self.backup_task.done()
+
+    def start_backup(self):
+        if self.backup_running or self.restore_running:
+            return
+        store = self.store
+        game_dir = self.game_dir
+        cancel = self.backup_cancel = threading.Event()
+        self.backup_done_bytes = 0
+        self.backup_total_bytes = 0
+        self.ids.backup_cancel_button.disabled = False
+        self.ids.backup_status.text = "Creating backup..."
+        self.backup_progress_event = Clock.schedule_interval(self.update_backup_progress, 0.1)
+
+        def _backup():
+            # only files changed since the last backup are read and stored
+            return store.create(game_dir, CUSTOMS_ROOTS,
+                                progress_callback=self.backup_progress, cancel=cancel)
+
+        self.backup_task = TaskScheduler().submit(_backup, key='backup')
+        self.backup_task.add_done_callback(
+            lambda task: Clock.schedule_once(partial(self.backup_finished, task))
+        )
+
+    def cancel_backup(self, *args):
+        if self.backup_running:
+            self.backup_task.cancel()
+            self.backup_cancel.set()
+
+    def backup_progress(self, done, total):
+        # called from the compression threads
+        self.backup_done_bytes = done
+        self.backup_total_bytes = total
+
+    def update_backup_progress(self, dt):
+        done, total = self.backup_done_bytes, self.backup_total_bytes
+        percent = int(done * 100 / total) if total else 0
+        self.ids.backup_progress.value = percent
+        self.ids.backup_status.text = "Creating backup... {}% ({:.1f} / {:.1f} MB)".format(
+            percent, done / (1024 * 1024), total / (1024 * 1024)
+        )
+
+    def backup_finished(self, task, dt):
+        self.backup_progress_event.cancel()
+        self.ids.backup_cancel_button.disabled = True
+        self.ids.backup_progress.value = 0
+        self.show_snapshots()
+        if task.cancelled() or isinstance(task.exception(), BackupCancelled):
+            self.report_info("Backup cancelled, the previous backup was kept.", dt)
+        elif task.exception() is not None:
+            self.report_error(task.exception(), dt)
+        else:
+            stats = task.result()
+            self.report_info("Backup created! {} of {} files changed.".format(stats['changed'], stats['files']), dt)
+
+    @property
+    def restore_running(self):
+        return self.restore_task is not None and not self.restore_task.done()
+
     def restore_backup(self):
         try:
+            if self.backup_running:
+                raise Exception("Backup is in progress!")
+            if self.restore_running:
+                raise Exception("Restore is in progress!")
             if not self.backup_exists:
                 raise Exception("Backup does not exist!")
-            self.clean_customs(skip_dialog=True)
-            with ZipFile("{}/backup.zip".format(self.backup_destination_path), 'r') as zip_ref:
-                    zip_ref.extractall(self.game_dir)
-            self.app.custom_dispatcher.do_refresh()
-            Clock.schedule_once(partial(self.report_info, "Backup restored!"))
         except Exception as exc:
-                Clock.schedule_once(partial(self.report_error, exc))
+            Clock.schedule_once(partial(self.report_error, exc))
+            return
+
+        store = self.store
+        game_dir = self.game_dir
+        self.ids.backup_status.text = "Comparing backup with Customs..."
+
+        def _plan():
+            # dry run, nothing is touched until the user confirms
+            if not store.snapshots():
+                return None
+            return store.plan_restore(game_dir, CUSTOMS_ROOTS)
+
+        self.restore_task = TaskScheduler().submit(_plan, key='restore')
+        self.restore_task.add_done_callback(
+            lambda task: Clock.schedule_once(partial(self.confirm_restore, task))
+        )
+
+    def confirm_restore(self, task, dt):
+        self.show_snapshots()
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.report_error(task.exception(), dt)
+            return
+        plan = task.result()
+
+        def action_cancel(*args):
+            self.restore_dialog.dismiss()
+
+        def action_confirm(*args):
+            self.restore_dialog.dismiss()
+            self.start_restore(plan)
+
+        if plan is None:
+            text = "This backup was made by an older version, Customs/Cars and Customs/Liveries will be replaced entirely.\n\nDo you want to continue?"
+        elif not (plan['add'] or plan['update'] or plan['delete'] or plan['touch']):
+            self.report_info("Customs already match the backup, nothing to restore.", dt)
+            return
+        else:
+            text = "{} files will be added, {} overwritten and {} deleted ({:.1f} MB to write), {} files are unchanged.\n\nDo you want to continue?".format(
+                len(plan['add']), len(plan['update']), len(plan['delete']),
+                plan['bytes'] / (1024 * 1024), plan['unchanged'] + len(plan['touch'])
+            )
+
+        self.restore_dialog = MDDialog(
+            title="Restore backup",
+            text=text,
+            buttons=[
+                MDFlatButton(
+                    text="Cancel", on_release=action_cancel
+                ),
+                MDFlatButton(
+                    text="Confirm", on_release=action_confirm
+                ),
+            ],
+        )
+        self.restore_dialog.open()
+
+    def start_restore(self, plan):
+        if self.backup_running or self.restore_running:
+            return
+        store = self.store
+        game_dir = self.game_dir
+        self.ids.backup_status.text = "Restoring backup..."
+
+        def _restore():
+            if plan is None:
+                store.restore(game_dir, CUSTOMS_ROOTS)
+            else:
+                store.apply_restore(game_dir, plan)
+            InstalledIndex().rescan()
+
+        self.restore_task = TaskScheduler().submit(_restore, key='restore')
+        self.restore_task.add_done_callback(
+            lambda task: Clock.schedule_once(partial(self.restore_finished, task))
+        )
+
+    def restore_finished(self, task, dt):
+        self.show_snapshots()
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.report_error(task.exception(), dt)
+            return
+        self.app.custom_dispatcher.do_refresh()
+        self.report_info("Backup restored!", dt)
 
-    @_refresh_config
     def clean_customs(self, skip_dialog=False):
 
         def action_cancel(*args):
@@ -308,11 +647,14 @@ class BackupScreen(MDScreen):
 
         def action_confirm(*args):
             try:
+                if self.backup_running or self.restore_running:
+                    raise Exception("Backup is in progress!")
                 shutil.rmtree(self.liveries_path)
                 shutil.rmtree(self.cars_path)
 
                 os.makedirs(self.liveries_path, exist_ok=True)
                 os.makedirs(self.cars_path, exist_ok=True)
+                InstalledIndex().rescan()
 
                 self.clean_dialog.dismiss()
                 if not skip_dialog:
@@ -347,6 +689,17 @@ class SkinScreen(MDScreen):
         self.name = str(id_)
         super(SkinScreen, self).__init__(*args, **kwargs)
 
+    def set_records(self, records):
+        # only rows in the viewport get a SkinWidget, the rest is plain data
+        self.ids.skin_list.data = records
+
+    def apply_ops(self, ops, old_keys, record_of):
+        # in place, the list only redraws the rows that changed
+        apply_ops(self.ids.skin_list.data, ops, old_keys, record_of)
+
+    def clear(self):
+        self.ids.skin_list.data = []
+
 
 class ZipSkinScreen(MDScreen):
 
@@ -361,11 +714,14 @@ class ZipSkinScreen(MDScreen):
         self.file_manager = MDFileManager(
             exit_manager=self.exit_manager, select_path=self.select_path
         )
-        self.game_dir = self.app.config.get("acc", "skins_dir")
-        
+        self.pack_task = None
+        self.pack_progress_event = None
+        self.pack_done_bytes = 0
+        self.pack_total_bytes = 0
+
     def file_manager_open(self, managerType):
         self.managerType = managerType
-        path = "{}\Customs\Cars".format(self.game_dir)
+        path = "{}\Customs\Cars".format(ConfigService().snapshot.get("acc", "skins_dir"))
         if managerType == "car_destination":
             path = "{}\Desktop".format(Path.home())
         self.file_manager.show(os.path.expanduser(path))
@@ -406,8 +762,46 @@ class ZipSkinScreen(MDScreen):
         if self.manager.current != self.name:
             self.manager.current = self.name
 
+    def report_error(self, exc, dt):
+        Snackbar(
+            text="[color=#f2776d]ERROR: {}[/color]".format(exc),
+            size_hint_x=1,
+            snackbar_y="30dp",
+            snackbar_x="30dp",
+            bg_color=get_color_from_hex("#544746")
+        ).open()
+
+    @property
+    def pack_running(self):
+        return self.pack_task is not None and not self.pack_task.done()
+
+    def collect_members(self, skin_path):
+        # (path, arcname) of the car json and its livery, no chdir - the
+        # download workers share the process working directory
+        if not os.path.isfile(skin_path):
+            raise Exception("Invalid car.json path")
+
+        with open(skin_path, 'rb') as f:
+            content = f.read().decode('utf-16')
+
+        data = json.loads(content)
+        skin_name = data['customSkinName']
+
+        cars_dir = os.path.dirname(skin_path)
+        liveries_dir = os.path.join(cars_dir, 'Liveries')
+        if not os.path.exists(liveries_dir):
+            liveries_dir = os.path.join(os.path.dirname(cars_dir), 'Liveries')
+
+        members = [(skin_path, 'Customs/Cars/{}'.format(os.path.basename(skin_path)))]
+        for root, _, files in os.walk(os.path.join(liveries_dir, skin_name)):
+            for f in files:
+                if f.endswith('_0.dds'):
+                    continue
+                p = os.path.join(root, f)
+                members.append((p, 'Customs/Liveries/{}'.format(os.path.relpath(p, liveries_dir).replace(os.sep, '/'))))
+        return skin_name, members
+
     def create(self, *args, **kwargs):
-        oldwd = os.getcwd()
         if self.zip_destination.text == "" or self.car_source.text == "":
             Snackbar(
                 text="[color=#f2776d]ERROR: The car source path and zip target path fields must be set![/color]",
@@ -417,44 +811,51 @@ class ZipSkinScreen(MDScreen):
                 bg_color=get_color_from_hex("#544746")
             ).open()
             return
+        if self.pack_running:
+            return
 
-        try:
-            os.chdir(os.path.dirname(self.car_source.text))
-            skin_path = self.car_source.text
-            is_file = os.path.isfile(skin_path)
-            if not is_file:
-                raise Exception("Invalid car.json path")
-
-            with open(skin_path, 'rb') as f:
-                content = f.read().decode('utf-16')
-
-            data = json.loads(content)            
-            skin_name = data['customSkinName']
-
-            with ZipFile('{}\{}.zip'.format(self.zip_destination.text, skin_name), 'w', compression=ZIP_DEFLATED) as z:
-                z.write(skin_path, 'Customs\Cars\{}'.format(os.path.basename(skin_path)))
-                
-                if os.path.exists('Liveries'):
-                    os.chdir('Liveries')
-                else:
-                    os.chdir('..\Liveries')
-
-                for root, _, files in os.walk(skin_name):
-                    for f in files:
-                        if f.endswith('_0.dds'):
-                            continue
-                        p = os.path.join(root, f)
-                        z.write(p, 'Customs\Liveries\{}'.format(p))
+        skin_path = self.car_source.text
+        destination = self.zip_destination.text
+        self.pack_done_bytes = 0
+        self.pack_total_bytes = 0
+        self.ids.zip_create_button.disabled = True
+        self.ids.zip_status.text = "Creating zip..."
+        self.pack_progress_event = Clock.schedule_interval(self.update_pack_progress, 0.1)
+
+        def _pack():
+            skin_name, members = self.collect_members(skin_path)
+            zip_path = os.path.join(destination, '{}.zip'.format(skin_name))
+            # members are compressed in parallel, textures that barely
+            # compress are stored
+            pack(zip_path, members, progress_callback=self.pack_progress)
+            return zip_path
+
+        self.pack_task = TaskScheduler().submit(_pack, key='zip_skin')
+        self.pack_task.add_done_callback(
+            lambda task: Clock.schedule_once(partial(self.pack_finished, task))
+        )
 
-        except Exception as exc:
-            Snackbar(
-                text="[color=#f2776d]ERROR: {}[/color]".format(exc),
-                size_hint_x=1,
-                snackbar_y="30dp",
-                snackbar_x="30dp",
-                bg_color=get_color_from_hex("#544746")
-            ).open()
+    def pack_progress(self, done, total):
+        # called from the compression threads
+        self.pack_done_bytes = done
+        self.pack_total_bytes = total
+
+    def update_pack_progress(self, dt):
+        done, total = self.pack_done_bytes, self.pack_total_bytes
+        percent = int(done * 100 / total) if total else 0
+        self.ids.zip_progress.value = percent
+        self.ids.zip_status.text = "Creating zip... {}% ({:.1f} / {:.1f} MB)".format(
+            percent, done / (1024 * 1024), total / (1024 * 1024)
+        )
+
+    def pack_finished(self, task, dt):
+        self.pack_progress_event.cancel()
+        self.ids.zip_create_button.disabled = False
+        self.ids.zip_progress.value = 0
+        self.ids.zip_status.text = ""
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.report_error(task.exception(), dt)
         else:
-            toast("Zip has been created at {}\{}.zip".format(self.zip_destination.text, skin_name))
-        finally:
-            os.chdir(oldwd)
+            toast("Zip has been created at {}".format(task.result()))
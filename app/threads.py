@@ -1,5 +1,9 @@
 import threading
 import queue
+import itertools
+import time
+
+from concurrent.futures import Future
 
 
 class Singleton(type):
@@ -10,30 +14,127 @@ class Singleton(type):
         return self._instances[self]
 
 
+# lower value runs first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+
+class Task(Future):
+
+    def __init__(self, fn, priority, key):
+        super(Task, self).__init__()
+        self.fn = fn
+        self.priority = priority
+        self.key = key
+        self.started = False
+        self.submitted_at = time.monotonic()
+
+
 # this class is used to have better control over threads
-# using ThreadPoolExecutor you don't have control over queue
-# which will be required later in this project
-class ThreadPool(metaclass=Singleton):
+# using ThreadPoolExecutor you don't have control over queue,
+# here tasks are ordered by priority, identical pending tasks
+# are merged and every task gets a cancellable future
+class TaskScheduler(metaclass=Singleton):
 
-    def __init__(self, **kwargs):
-        self.q = queue.Queue()
-        self.workers_num = 3
+    def __init__(self, workers_num=3, **kwargs):
+        self.q = queue.PriorityQueue()
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+        self.pending = {}
+        self.workers_num = 0
         self.workers = []
-        for _ in range(self.workers_num):
-            self.workers.append(
-               threading.Thread(target=self.worker, kwargs={"q": self.q}, daemon=True).start()
-            )
 
-    def submit(self, item):
-        self.q.put(item)
+        self.queued = 0
+
+        # imported here, metrics needs Singleton from this module
+        from .metrics import Metrics
+        self.metrics = Metrics()
+        self.metrics.add_collector(self.gauges)
+
+        self.set_workers_num(workers_num)
+
+    def set_workers_num(self, workers_num):
+        workers_num = max(int(workers_num), 1)
+        with self.lock:
+            diff = workers_num - self.workers_num
+            self.workers_num = workers_num
+            for _ in range(diff):
+                worker = threading.Thread(target=self.worker, kwargs={"q": self.q}, daemon=True)
+                worker.start()
+                self.workers.append(worker)
+            for _ in range(-diff):
+                # stop markers jump the queue, any idle worker picks one up
+                self.q.put((-1, next(self.counter), None))
+
+    def submit(self, item, priority=PRIORITY_NORMAL, key=None):
+        with self.lock:
+            if key is not None:
+                task = self.pending.get(key)
+                if task is not None and not task.started and not task.done():
+                    # identical job is still waiting, only raise its priority
+                    self.metrics.inc('tasks_deduplicated_total')
+                    if priority < task.priority:
+                        task.priority = priority
+                        self.q.put((priority, next(self.counter), task))
+                    return task
+
+            task = Task(item, priority, key)
+            if key is not None:
+                self.pending[key] = task
+            self.queued += 1
+            self.q.put((priority, next(self.counter), task))
+        return task
+
+    def cancel_all(self):
+        with self.lock:
+            tasks = list(self.pending.values())
+        for task in tasks:
+            task.cancel()
+
+    def gauges(self):
+        with self.lock:
+            return {'task_workers': self.workers_num, 'task_queue_depth': self.queued}
 
+    def _take(self, task):
+        # returns False for stale queue entries and cancelled tasks
+        with self.lock:
+            if task.started:
+                return False
+            task.started = True
+            self.queued -= 1
+            if task.key is not None and self.pending.get(task.key) is task:
+                del self.pending[task.key]
+            if not task.set_running_or_notify_cancel():
+                self.metrics.inc('tasks_total', status='cancelled')
+                return False
+            wait = time.monotonic() - task.submitted_at
+        self.metrics.observe('task_queue_wait_seconds', wait)
+        return True
 
     def worker(self, q):
         while True:
+            _, _, task = q.get()
             try:
-                item = q.get()
-                item()
+                if task is None:
+                    with self.lock:
+                        self.workers.remove(threading.current_thread())
+                    return
+                if not self._take(task):
+                    continue
+                started = time.perf_counter()
+                try:
+                    result = task.fn()
+                except Exception as exc:
+                    # TODO: add better error handling
+                    print(exc)
+                    self.metrics.observe('task_run_seconds', time.perf_counter() - started)
+                    self.metrics.inc('tasks_total', status='failed')
+                    self.metrics.event('task_failed', key=task.key, error=str(exc))
+                    task.set_exception(exc)
+                else:
+                    self.metrics.observe('task_run_seconds', time.perf_counter() - started)
+                    self.metrics.inc('tasks_total', status='completed')
+                    task.set_result(result)
+            finally:
                 q.task_done()
-            except Exception as exc:
-                # TODO: add better error handling
-                print(exc)
@@ -0,0 +1,221 @@
+import os
+import asyncio
+import threading
+
+from functools import partial
+from contextlib import asynccontextmanager
+
+from .threads import Singleton, TaskScheduler, PRIORITY_NORMAL
+from .config import ConfigService
+from .metrics import Metrics
+from .clients import ArchiveCache, SpoolWriter, DOWNLOAD_COMPLETE, DOWNLOAD_RESTART
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+TRANSPORT_THREADS = 'threads'
+TRANSPORT_ASYNCIO = 'asyncio'
+
+
+# settings the aiohttp session is built from, other changes keep it
+SESSION_SETTINGS = ('user', 'password', 'server', 'async_concurrency', 'max_connections_per_host')
+
+# generic/transport -> transport in use, each value is checked once
+_resolved = {}
+
+
+def selected_transport():
+    # generic/transport, the asyncio engine needs aiohttp
+    transport = ConfigService().snapshot.get('generic', 'transport', TRANSPORT_THREADS)
+    if transport not in _resolved:
+        if transport == TRANSPORT_ASYNCIO and aiohttp is None:
+            print("aiohttp is not installed, using the threaded transport")
+            _resolved[transport] = TRANSPORT_THREADS
+        else:
+            _resolved[transport] = transport
+    return _resolved[transport]
+
+
+def session_settings(config):
+    return tuple(config.get('generic', name) for name in SESSION_SETTINGS)
+
+
+@asynccontextmanager
+async def holding(lock):
+    # a threading lock held by a coroutine, a contended one is waited for
+    # on an executor thread instead of blocking the loop
+    if not lock.acquire(blocking=False):
+        acquired = asyncio.get_running_loop().run_in_executor(None, lock.acquire)
+        try:
+            await asyncio.shield(acquired)
+        except asyncio.CancelledError:
+            # the executor still takes the lock, give it back right away
+            acquired.add_done_callback(lambda _: lock.release())
+            raise
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+# streams downloads on one background event loop thread, dozens of them can
+# wait on the network at once without a worker thread each; finished archives
+# are handed over to the TaskScheduler workers for extraction
+class AsyncTransport(metaclass=Singleton):
+
+    _CHUNK_SIZE = 65536
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.session = None
+        self.settings = None
+        self.semaphore = None
+        # session -> downloads running on it
+        self.active = {}
+        self.inflight = {}
+        ConfigService().subscribe(self.on_config_changed, sections=('generic',))
+
+    def on_config_changed(self, config):
+        asyncio.run_coroutine_threadsafe(self.retire_session(session_settings(config)), self.loop)
+
+    async def retire_session(self, settings):
+        # new credentials, server or limits: the next download opens a new
+        # session, the old one is closed once its downloads are finished
+        if self.session is None or settings == self.settings:
+            return
+        session, self.session, self.semaphore = self.session, None, None
+        if not self.active.get(session):
+            self.active.pop(session, None)
+            await session.close()
+
+    def get_session(self, http_client):
+        # loop thread only
+        if self.session is None:
+            config = ConfigService().snapshot
+            self.settings = session_settings(config)
+            concurrency = max(config.getint('generic', 'async_concurrency', 32), 1)
+            connector = aiohttp.TCPConnector(
+                limit=concurrency,
+                limit_per_host=config.getint('generic', 'max_connections_per_host', 0),
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                auth=aiohttp.BasicAuth(http_client.user, http_client.password),
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60),
+            )
+            self.semaphore = asyncio.Semaphore(concurrency)
+        return self.session
+
+    def install(self, job, http_client, priority=PRIORITY_NORMAL, download_progress=None,
+                install_progress=None, on_install=None):
+        # same contract as submitting SkinJob.install to the TaskScheduler,
+        # returns a concurrent future that can be cancelled
+        coro = self.run_install(job, http_client, priority, download_progress, install_progress, on_install)
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def run_install(self, job, http_client, priority, download_progress, install_progress, on_install):
+        # the same skin listed by several leagues is installed once, it is
+        # cancelled only when everybody waiting for it has been cancelled
+        entry = self.inflight.get(job.key)
+        if entry is None:
+            task = asyncio.ensure_future(
+                self.install_once(job, http_client, priority, download_progress, install_progress, on_install)
+            )
+            entry = self.inflight[job.key] = [task, 0]
+            task.add_done_callback(lambda _: self.inflight.pop(job.key, None))
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            entry[1] -= 1
+            if not entry[1] and not task.done():
+                if self.inflight.get(job.key) is entry:
+                    del self.inflight[job.key]
+                task.cancel()
+
+    async def install_once(self, job, http_client, priority, download_progress, install_progress, on_install):
+        key = job.local_file.archive_key(job.sum_control, job.remote_timestamp)
+        # the same per archive lock as SkinJob.install, an archive is never
+        # fetched and spooled twice at the same time
+        async with holding(ArchiveCache().key_lock(key)):
+            if ArchiveCache().get(key) is None:
+                # a few range requests patch an installed skin, they run on a
+                # worker thread through the shared requests session
+                progress = download_progress or (lambda max_size, chunk_size: None)
+                task = TaskScheduler().submit(partial(job.sync_delta, http_client, progress), priority=priority,
+                                              key=('delta', job.key))
+                if await asyncio.wrap_future(task):
+                    return
+            archive = await self.fetch(job, http_client, key, download_progress)
+
+            def _install():
+                if on_install is not None:
+                    on_install()
+                job.finish(key, archive, install_progress)
+
+            # extraction is CPU and disk work, it goes to the worker threads
+            task = TaskScheduler().submit(_install, priority=priority, key=('install', job.key))
+            await asyncio.wrap_future(task)
+
+    async def fetch(self, job, http_client, key, download_progress):
+        # returns the cached archive, None means the spooled temp file
+        download_progress = download_progress or (lambda max_size, chunk_size: None)
+        archive = ArchiveCache().get(key)
+        if archive is not None:
+            # unchanged archive is already on disk - recreate locally
+            size = os.path.getsize(archive)
+            download_progress(size, size)
+            return archive
+        session = self.get_session(http_client)
+        semaphore = self.semaphore
+        self.active[session] = self.active.get(session, 0) + 1
+        try:
+            async with semaphore:
+                temp_file = job.local_file.create_temp(job.remote_timestamp)
+                await self.download_file(session, http_client, job.remote_skin_path, temp_file,
+                                         download_progress, job.sum_control)
+        finally:
+            self.active[session] -= 1
+            if not self.active[session] and session is not self.session:
+                # retired while this download was running
+                del self.active[session]
+                await session.close()
+        return job.local_file.cache_temp(key)
+
+    async def throttle(self, bandwidth, amount):
+        wait = bandwidth.take(amount)
+        while wait > 0:
+            await asyncio.sleep(min(wait, 0.1))
+            wait = bandwidth.deficit()
+
+    async def download_file(self, session, http_client, endpoint, file, progress_callback, checksum=None):
+        # HTTPClient.download_file on the event loop; the response is read
+        # only as fast as it is written, aiohttp's bounded buffer pushes back
+        loop = asyncio.get_running_loop()
+        metrics = Metrics()
+        with file as fd, metrics.span('download', transport=TRANSPORT_ASYNCIO) as span:
+            span['bytes'] = 0
+            for attempt in range(2):
+                if attempt:
+                    metrics.inc('download_retries_total')
+                spool = SpoolWriter(fd, checksum, progress_callback, span)
+                async with session.get(http_client.server + endpoint, headers=spool.headers()) as resp:
+                    action = spool.begin(resp.status, resp.headers)
+                    if action == DOWNLOAD_RESTART:
+                        continue
+                    await loop.run_in_executor(None, spool.seed)
+                    if action != DOWNLOAD_COMPLETE:
+                        async for chunk in resp.content.iter_chunked(self._CHUNK_SIZE):
+                            await self.throttle(http_client.bandwidth, len(chunk))
+                            # buffered 64 KiB writes land in the page cache, cheaper
+                            # than a round trip to an executor
+                            spool.write(chunk)
+                    spool.finish()
+                    return
+            raise Exception("Unable to resume download of {}".format(endpoint))
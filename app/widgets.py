@@ -1,11 +1,7 @@
-from functools import partial
-
-from kivy.clock import mainthread, Clock
 from kivymd.app import MDApp
 from kivymd.uix.gridlayout import MDGridLayout
 from kivymd.uix.button import MDRectangleFlatButton, MDRectangleFlatIconButton
 from kivymd.uix.progressbar import MDProgressBar
-from kivymd.uix.snackbar import Snackbar
 from kivymd.uix.label import MDLabel
 from kivy.utils import get_color_from_hex
 from kivymd.uix.boxlayout import MDBoxLayout
@@ -14,9 +10,9 @@ from kivymd.theming import ThemableBehavior
 from kivymd.uix.behaviors import TouchBehavior
 from kivy.properties import ObjectProperty, BooleanProperty, NumericProperty
 from kivy.metrics import dp
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
 
-from app.clients import LocalFileClient, HTTPClient
-from app.threads import ThreadPool
+from app.engine import STATE_MISSING, STATE_UPDATE, STATE_RECREATE
 
 
 class ToolbarItemWidget(MDBoxLayout, ThemableBehavior, HoverBehavior, TouchBehavior):
@@ -87,117 +83,80 @@ class LeagueButtonWidget(MDRectangleFlatButton):
 
         self.set_active()
         self.app.root.content.ids.content_manager.current = self.id
+        self.app.root.content.activate_league(self.id)
 
 
-class SkinWidget(MDGridLayout):
-
-    _STATE_MISSING = "missing"
-    _STATE_RECREATE = "recreate"
-    _STATE_DOWNLOAD = "download"
-    _STATE_UPDATE = "update"
+class SkinWidget(RecycleDataViewBehavior, MDGridLayout):
+    # recycled row of a league list, state and progress are kept by the
+    # SkinModel it is bound to, the row only draws them
 
-    __slots__ = ('id', 'desc_label', 'percentage_label', 'progressbar', 'download_button', 'temp_size')
+    __slots__ = ('id', 'desc_label', 'percentage_label', 'progressbar', 'download_button', 'model')
 
-    def __init__(self, league_id, skin, skin_type):
+    def __init__(self, **kwargs):
         self.app = MDApp.get_running_app()
-
-        # TODO: do refactoring of fields, it's a mess now
-        self.sum_control = skin.get('sum')
-        self.skin_name, self.skin_ext = skin.get('skin_name').split('.')
-        
-        # HACKY - FIX ME, the field should not be called car_name
-        s = self.skin_name.split("-") 
-        self.car_name = s[1]
-        # END OF FIX ME
-
-        self.league_id = league_id
-        self.skin_type = skin_type
-        self.league_color = skin.get('league_color_rgb')
-
-        # new fields
-        self.driver_name = skin.get('driver_name', '')
-        self.team_name = skin.get('team_name', '')
-        self.league_name = skin.get('league_name', '')
-        self.league_type = skin.get('league_type', 'single')
-        self.car_name_ext = skin.get('car_name', '')
-        self.car_class = skin.get('car_class', '')
-        self.car_year = str(skin.get('car_year', ''))
-        self.car_number = str(skin.get('number', ''))
-
-        self.remote_skin_path = '/api/skins/{}/{}/{}/download'.format(self.league_id, self.car_name, self.skin_name)
-        self.remote_timestamp = skin.get('timestamp')
-        super(SkinWidget, self).__init__()
-
-        self.pool = ThreadPool()
-        self.config = self.app.config
-        self.dispatcher = self.app.custom_dispatcher
-
-        self.http_client = HTTPClient()
-        self.local_file = LocalFileClient(self.skin_type, self.car_name, self.skin_name, self.skin_ext)
-
+        self.model = None
+        super(SkinWidget, self).__init__(**kwargs)
         self.set_attr()
-        self.register_events()
-        Clock.schedule_once(self.initialize_data)
-        Clock.schedule_once(self.refresh_state)
-        self.download_in_progress = False
-
-    def initialize_data(self, dt):
-        self.league_color_bar.md_bg_color = get_color_from_hex(self.league_color)
-        self.desc_label.car_number.text = "[b]{}[/b]".format(self.car_number)
-        self.desc_label.car_model.text = self.car_name_ext
-        if self.league_type == 'swap':
-            self.desc_label.driver_name.text = "[b]{}[/b]".format(self.team_name)
-            self.desc_label.team_name.text = ""
-        else:
-            self.desc_label.driver_name.text = "[b]{}[/b]".format(self.driver_name)
-            self.desc_label.team_name.text = self.team_name
+        self.download_button.bind(on_release=self.download_start)
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.league_color_bar.md_bg_color = get_color_from_hex(data['league_color'])
+        self.desc_label.car_number.text = "[b]{}[/b]".format(data['car_number'])
+        self.desc_label.car_model.text = data['car_model']
+        self.desc_label.driver_name.text = "[b]{}[/b]".format(data['driver_name'])
+        self.desc_label.team_name.text = data['team_name']
+        self.bind_model(self.app.root.content.skins.get(data['skin_id']))
+
+    def bind_model(self, model):
+        if self.model is not None:
+            self.model.unbind(state=self.refresh_state, download_in_progress=self.refresh_state,
+                              installing=self.refresh_state, progress=self.update_progress_bar)
+        self.model = model
+        if model is None:
+            return
+        model.bind(state=self.refresh_state, download_in_progress=self.refresh_state,
+                   installing=self.refresh_state, progress=self.update_progress_bar)
+        self.refresh_state()
 
-    def on_refresh(self, *args):
-        Clock.schedule_once(self.refresh_state)
+    def download_start(self, *args):
+        if self.model is not None:
+            self.model.download_start()
 
-    @mainthread
-    def refresh_state(self, dt):
+    def refresh_state(self, *args):
         recreate_color = get_color_from_hex("#00cc00")
         download_color = get_color_from_hex("#00cc00")
         update_color = get_color_from_hex("#00cc00")
-        if not self.local_file.car_exists and self.skin_type == 'ac':
+        install_color = get_color_from_hex("#ffaa00")
+        state = self.model.state
+        if state == STATE_MISSING:
             # Car files missing - cannot install skins
-            self.state = self._STATE_MISSING
-
             self.download_button.disabled = True
             self.download_button.text = "MISSING CAR"
             self.download_button.icon = "sync-off"
             self.percentage_label.text = "[b]0%[/b]"
             self.percentage_label.text_color = get_color_from_hex("#ffffff")
             self.progressbar.width = 150
-        elif self.local_file.car_exists and self.local_file.skin_exists:
-            if self.remote_timestamp > self.local_file.timestamp:
-                # Files downloaded but new version discovered on the server - update phase
-                self.state = self._STATE_UPDATE
-
-                self.progressbar.color = update_color
-                self.download_button.disabled = False
-                self.progressbar.color = update_color
-                self.download_button.text = "[b]UPDATE[/b]"
-                self.download_button.icon = "autorenew"
-                self.progressbar.value = 0
-                self.progressbar.width = 150
-                self.percentage_label.text = "[b]0%[/b]"
-                self.percentage_label.text_color = get_color_from_hex("#ffffff")
-            else:
-                # Files downloaded, everything up to date - recreate phase
-                self.state = self._STATE_RECREATE
-                self.download_button.disabled = False
-                self.download_button.text = "[b]RECREATE[/b]"
-                self.percentage_label.text = "[b]READY[/b]"
-                self.progressbar.width = 0
-                self.progressbar.value = 0
-                self.download_button.icon = "autorenew"
-                self.percentage_label.text_color = recreate_color
+        elif state == STATE_UPDATE:
+            # Files downloaded but new version discovered on the server - update phase
+            self.progressbar.color = update_color
+            self.download_button.disabled = False
+            self.download_button.text = "[b]UPDATE[/b]"
+            self.download_button.icon = "autorenew"
+            self.progressbar.value = 0
+            self.progressbar.width = 150
+            self.percentage_label.text = "[b]0%[/b]"
+            self.percentage_label.text_color = get_color_from_hex("#ffffff")
+        elif state == STATE_RECREATE:
+            # Files downloaded, everything up to date - recreate phase
+            self.download_button.disabled = False
+            self.download_button.text = "[b]RECREATE[/b]"
+            self.percentage_label.text = "[b]READY[/b]"
+            self.progressbar.width = 0
+            self.progressbar.value = 0
+            self.download_button.icon = "autorenew"
+            self.percentage_label.text_color = recreate_color
         else:
             # Skin files missing - download phase
-            self.state = self._STATE_DOWNLOAD
-
             self.download_button.disabled = False
             self.progressbar.color = download_color
             self.download_button.text = "[b]DOWNLOAD[/b]"
@@ -207,11 +166,17 @@ class SkinWidget(MDGridLayout):
             self.percentage_label.text = "[b]0%[/b]"
             self.percentage_label.text_color = get_color_from_hex("#ffffff")
 
+        if self.model.download_in_progress:
+            self.download_button.disabled = True
+            self.progressbar.color = install_color if self.model.installing else download_color
+            self.progressbar.width = 150
+            self.percentage_label.text_color = get_color_from_hex("#ffffff")
+            self.update_progress_bar(self.model, self.model.progress)
+
     def set_attr(self):
         # TODO: dirty hack - fix me
         for obj in self.children[0].children:
             setattr(self, obj.name, obj)
-        self.temp_size = 0
 
         if hasattr(self, "progress_bar_box"):
             for obj in self.progress_bar_box.children:
@@ -221,70 +186,15 @@ class SkinWidget(MDGridLayout):
             for obj in self.download_box.children:
                 setattr(self, obj.name, obj)
 
-    def register_events(self):
-        self.download_button.bind(on_release=self.download_start)
-        self.dispatcher.bind(on_refresh=self.on_refresh)
-        self.dispatcher.bind(on_recreate_all=self.download_start)
-        self.dispatcher.bind(on_download_all=self.on_download_all)
-
-    def unregister_events(self):
-        self.download_button.unbind(on_release=self.download_start)
-        self.dispatcher.unbind(on_refresh=self.on_refresh)
-        self.dispatcher.unbind(on_recreate_all=self.download_start)
-        self.dispatcher.unbind(on_download_all=self.on_download_all)
-
-    def on_download_all(self, *args):
-        current_league_id = self.app.root.content.ids.content_manager.current
-        if self.league_id == current_league_id and self.state in (self._STATE_DOWNLOAD, self._STATE_UPDATE):
-            self.download_start()
-
-    def download_start(self, *args):
-        self.progressbar.width = 150
-        self.percentage_label.text = "[b]0%[/b]"
-        self.percentage_label.text_color = get_color_from_hex("#ffffff")
-        if self.download_in_progress:
+    def update_progress_bar(self, model, percent):
+        if not model.download_in_progress:
             return
-        self.download_in_progress = True
-        self.temp_size = 0
-        Clock.schedule_once(self.set_pre_download_btn_ui)
-
-        def _download():            
-            try:
-                temp_file = self.local_file.create_temp()
-                self.http_client.download_file(self.remote_skin_path, temp_file, self.download_progress)
-                self.local_file.extract_temp()
-            except Exception as exc:
-                Clock.schedule_once(partial(self.report_error, exc))
-            finally:
-                Clock.schedule_once(self.refresh_state)
-                self.download_in_progress = False
-
-        self.pool.submit(_download)
-
-    def report_error(self, exc, dt):
-        Snackbar(
-            text="[color=#f2776d]ERROR: {}[/color]".format(exc),
-            size_hint_x=1,
-            snackbar_y="30dp",
-            snackbar_x="30dp",
-            bg_color=get_color_from_hex("#544746")
-        ).open()
-
-    def download_progress(self, max_size, chunk_size):
-        self.temp_size += chunk_size
-        percent = int(self.temp_size * 100 / max_size)
-        Clock.schedule_once(partial(self.update_progress_bar, percent))
-
-    @mainthread
-    def set_pre_download_btn_ui(self, dt):
-        self.progressbar.value = 0
-        self.percentage_label.text = "[b]0%[/b]"
-        self.download_button.disabled = True
-
-    @mainthread
-    def update_progress_bar(self, percent, dt):
         self.progressbar.value = percent
-        self.percentage_label.text = "[b]{}%[/b]".format(percent)
+        if model.installing:
+            # archive downloaded, members are being extracted
+            self.percentage_label.text = "[b]INSTALLING {}%[/b]".format(int(percent))
+        else:
+            self.percentage_label.text = "[b]{}%[/b]".format(int(percent))
 
 
 class DescriptionLabelWidget(MDBoxLayout):
@@ -0,0 +1,184 @@
+import os
+import shutil
+import tempfile
+import threading
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from zipfile import ZipFile, ZipInfo, ZIP_STORED, ZIP_DEFLATED, ZIP64_LIMIT
+
+from .metrics import traced
+
+
+_CHUNK_SIZE = 1024 * 1024
+_COMPRESS_LEVEL = 6
+# a few slices of a file are deflated quickly to guess how well it compresses,
+# DDS/PNG textures that save less than 10% are stored as they are
+_PROBE_SLICE = 64 * 1024
+_PROBE_LEVEL = 1
+_STORE_RATIO = 0.9
+
+
+def should_deflate(path, size=None):
+    size = os.path.getsize(path) if size is None else size
+    if size <= _PROBE_SLICE * 3:
+        return True
+    compressed = 0
+    with open(path, 'rb') as f:
+        for offset in (0, size // 2, size - _PROBE_SLICE):
+            f.seek(offset)
+            compressed += len(zlib.compress(f.read(_PROBE_SLICE), _PROBE_LEVEL))
+    return compressed < _PROBE_SLICE * 3 * _STORE_RATIO
+
+
+def compress_member(path, arcname, on_chunk=None):
+    # runs on a pool thread (zlib releases the GIL), the member data ends up
+    # in a temp file ready to be copied into the archive as it is
+    zinfo = ZipInfo.from_file(path, arcname)
+    zinfo.compress_type = ZIP_DEFLATED if should_deflate(path, zinfo.file_size) else ZIP_STORED
+    compressor = None
+    if zinfo.compress_type == ZIP_DEFLATED:
+        compressor = zlib.compressobj(_COMPRESS_LEVEL, zlib.DEFLATED, -15)
+    crc = 0
+    data = tempfile.TemporaryFile()
+    try:
+        with open(path, 'rb') as src:
+            for chunk in iter(lambda: src.read(_CHUNK_SIZE), b''):
+                crc = zlib.crc32(chunk, crc)
+                data.write(compressor.compress(chunk) if compressor is not None else chunk)
+                if on_chunk is not None:
+                    on_chunk(len(chunk))
+            if compressor is not None:
+                data.write(compressor.flush())
+    except BaseException:
+        data.close()
+        raise
+    zinfo.CRC = crc
+    zinfo.compress_size = data.tell()
+    data.seek(0)
+    return zinfo, data
+
+
+def write_member(zf, zinfo, data):
+    # appends an already compressed member, ZipFile has no public api for it
+    # so this does what ZipFile.open(..., 'w') does without the compressor
+    zip64 = zinfo.file_size > ZIP64_LIMIT or zinfo.compress_size > ZIP64_LIMIT
+    with zf._lock:
+        zf.fp.seek(zf.start_dir)
+        zinfo.header_offset = zf.fp.tell()
+        zf._writecheck(zinfo)
+        zf._didModify = True
+        zf.fp.write(zinfo.FileHeader(zip64))
+        shutil.copyfileobj(data, zf.fp, _CHUNK_SIZE)
+        zf.filelist.append(zinfo)
+        zf.NameToInfo[zinfo.filename] = zinfo
+        zf.start_dir = zf.fp.tell()
+
+
+@traced('pack')
+def pack(zip_path, members, progress_callback=None, jobs=None):
+    # members is a list of (path, arcname), the archive is written aside
+    # and moved in place when complete
+    sizes = [os.path.getsize(path) for path, _ in members]
+    total = sum(sizes)
+    lock = threading.Lock()
+    done = [0]
+    stats = {'files': len(members), 'stored': 0, 'deflated': 0, 'bytes_in': total, 'bytes_out': 0}
+
+    def on_chunk(size):
+        with lock:
+            done[0] += size
+            if progress_callback is not None:
+                progress_callback(done[0], total)
+
+    if progress_callback is not None:
+        progress_callback(0, total)
+
+    tmp_path = "{}.part".format(zip_path)
+    try:
+        with ZipFile(tmp_path, 'w') as zf, ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+            futures = [pool.submit(compress_member, path, arcname, on_chunk) for path, arcname in members]
+            # a single writer appends members in the order they finish
+            for future in as_completed(futures):
+                zinfo, data = future.result()
+                with data:
+                    write_member(zf, zinfo, data)
+                stats['deflated' if zinfo.compress_type == ZIP_DEFLATED else 'stored'] += 1
+                stats['bytes_out'] += zinfo.compress_size
+        os.replace(tmp_path, zip_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return stats
+
+
+def member_path(dest, name):
+    # same sanitizing as ZipFile.extract, members never leave dest
+    parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.', '..')]
+    if not parts or os.path.splitdrive(parts[0])[0]:
+        raise Exception("Invalid archive member: {}".format(name))
+    return os.path.join(dest, *parts)
+
+
+def extract_member(zf, zinfo, path):
+    # one open per member, the file gets its final size up front so the
+    # filesystem can allocate it in one go, data goes through a bounded buffer
+    with zf.open(zinfo) as src, open(path, 'wb') as dst:
+        if zinfo.file_size:
+            dst.truncate(zinfo.file_size)
+        buf = bytearray(min(zinfo.file_size, _CHUNK_SIZE) or 1)
+        view = memoryview(buf)
+        while True:
+            read = src.readinto(view)
+            if not read:
+                break
+            dst.write(view[:read])
+
+
+def extract(zip_path, dest, progress_callback=None, jobs=None):
+    # members are inflated on a thread pool (zlib releases the GIL), the
+    # callback gets (done bytes, total bytes) after every finished member
+    with ZipFile(zip_path, 'r') as zf:
+        members = []
+        for zinfo in zf.infolist():
+            path = member_path(dest, zinfo.filename)
+            if zinfo.is_dir():
+                os.makedirs(path, exist_ok=True)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                members.append((zinfo, path))
+
+    total = sum(zinfo.file_size for zinfo, _ in members)
+    done = 0
+    if progress_callback is not None:
+        progress_callback(done, total)
+
+    # ZipFile counts the open members of its shared handle without a lock,
+    # every pool thread reads through its own ZipFile
+    local = threading.local()
+    lock = threading.Lock()
+    opened = []
+
+    def _extract(zinfo, path):
+        zf = getattr(local, 'zf', None)
+        if zf is None:
+            zf = local.zf = ZipFile(zip_path, 'r')
+            with lock:
+                opened.append(zf)
+        extract_member(zf, zinfo, path)
+
+    # largest first, small members fill the gaps at the end
+    members.sort(key=lambda member: member[0].file_size, reverse=True)
+    try:
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+            futures = {pool.submit(_extract, zinfo, path): zinfo for zinfo, path in members}
+            for future in as_completed(futures):
+                future.result()
+                done += futures[future].file_size
+                if progress_callback is not None:
+                    progress_callback(done, total)
+    finally:
+        for zf in opened:
+            zf.close()
+    return total
@@ -0,0 +1,388 @@
+# Benchmarks of the non-UI paths against a local stand-in skin server
+#
+#   python -m benchmarks.run --skins 1000 --downloads 20 --member-mb 4 --jobs 3
+#
+# every scenario runs in its own process (peak RSS and CPU are per scenario),
+# results are printed and appended to benchmarks/results.jsonl together with
+# the git revision, a run with the same parameters is compared to the last one
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ('list_skins', 'list_skins_304', 'download', 'extract', 'sync', 'delta',
+             'backup', 'backup_incremental', 'restore', 'pack')
+# parameters that make two runs comparable
+PARAMS = ('skins', 'downloads', 'member_mb', 'jobs', 'transport', 'latency_ms', 'repeat')
+
+
+def percentile(values, percent):
+    # nearest rank
+    if not values:
+        return None
+    values = sorted(values)
+    index = max(int(round(percent / 100.0 * len(values))) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on linux, bytes on macOS
+        return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return None
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# scenarios, each runs in a child process and returns (latencies, bytes, items)
+
+def setup(args):
+    os.environ['KIVY_HOME'] = os.path.join(args.workdir, 'home')
+    from app.config import ConfigService, load_config
+    from app.threads import TaskScheduler
+    ConfigService().use(load_config(os.path.join(args.workdir, 'bench.ini')))
+    TaskScheduler(workers_num=args.jobs)
+
+
+def http_client():
+    from app.clients import ClientRegistry
+    return ClientRegistry().http_client
+
+
+def skin_jobs(args):
+    from app.engine import SkinJob, skin_type_of
+    skins = http_client().list_skins()[:args.downloads]
+    return [SkinJob(str(skin['league_id']), skin, skin_type_of(skin)) for skin in skins]
+
+
+def parallel(args, fn, items):
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        return list(pool.map(fn, items))
+
+
+def timed(fn, *fn_args):
+    started = time.perf_counter()
+    result = fn(*fn_args)
+    return time.perf_counter() - started, result
+
+
+def scenario_list_skins(args):
+    from app.clients import ManifestCache
+    client = http_client()
+    latencies = []
+    items = 0
+    for rep in range(args.repeat):
+        # an empty cache every time, full transfer and parse
+        client.manifest = ManifestCache(os.path.join(args.workdir, 'home', 'manifest-{}.json'.format(rep)))
+        elapsed, skins = timed(client.list_skins)
+        latencies.append(elapsed)
+        items += len(skins)
+    return latencies, 0, items
+
+
+def scenario_list_skins_304(args):
+    client = http_client()
+    client.list_skins()
+    latencies = []
+    items = 0
+    for _ in range(args.repeat):
+        elapsed, skins = timed(client.list_skins)
+        latencies.append(elapsed)
+        items += len(skins)
+    return latencies, 0, items
+
+
+def scenario_download(args):
+    client = http_client()
+
+    def _download(job):
+        size = [0]
+
+        def progress(max_size, chunk_size):
+            size[0] = max_size
+
+        temp_file = job.local_file.create_temp(job.remote_timestamp)
+        elapsed, _ = timed(client.download_file, job.remote_skin_path, temp_file, progress, job.sum_control)
+        return elapsed, size[0]
+
+    results = parallel(args, _download, skin_jobs(args))
+    return [elapsed for elapsed, _ in results], sum(size for _, size in results), len(results)
+
+
+def scenario_extract(args):
+    # installs the archives spooled by the download scenario
+    def _extract(job):
+        temp_file = job.local_file.create_temp(job.remote_timestamp)
+        size = temp_file.tell()
+        elapsed, _ = timed(job.local_file.extract_temp)
+        return elapsed, size
+
+    results = parallel(args, _extract, skin_jobs(args))
+    return [elapsed for elapsed, _ in results], sum(size for _, size in results), len(results)
+
+
+def scenario_sync(args, jobs=None):
+    # download and install end to end on the configured transport, the
+    # skins are installed already but delta sync is off in bench.ini
+    from concurrent.futures import wait
+    client = http_client()
+    jobs = jobs or skin_jobs(args)
+    sizes = {}
+    started = {}
+    latencies = []
+
+    def progress_for(job):
+        def progress(max_size, chunk_size):
+            sizes[job.key] = max_size
+        return progress
+
+    def done_for(job):
+        def done(task):
+            latencies.append(time.perf_counter() - started[job.key])
+        return done
+
+    tasks = []
+    for job in jobs:
+        started[job.key] = time.perf_counter()
+        task = job.submit(client, download_progress=progress_for(job))
+        task.add_done_callback(done_for(job))
+        tasks.append(task)
+    wait(tasks)
+    for task in tasks:
+        task.result()
+    return latencies, sum(sizes.values()), len(tasks)
+
+
+def scenario_delta(args):
+    # one member of every installed skin rewritten, then patched from the
+    # remote archives with range requests
+    from app.config import ConfigService
+    config = ConfigService()
+    config.config.set('generic', 'delta_sync', '1')
+    config.publish()
+    jobs = skin_jobs(args)
+    for job in jobs:
+        path = os.path.join(job.local_file.extract_path, 'Customs', 'Liveries', job.skin_name, 'sponsors.dds')
+        with open(path, 'r+b') as f:
+            f.write(b'\0' * 16)
+    return scenario_sync(args, jobs)
+
+
+def backup_store(args):
+    from app.backup import BackupStore
+    return BackupStore(os.path.join(args.workdir, 'backup'))
+
+
+def scenario_backup(args):
+    from app.backup import CUSTOMS_ROOTS
+    elapsed, stats = timed(backup_store(args).create, os.path.join(args.workdir, 'acc'), CUSTOMS_ROOTS)
+    return [elapsed], stats['bytes_read'], stats['files']
+
+
+def scenario_backup_incremental(args):
+    return scenario_backup(args)
+
+
+def scenario_restore(args):
+    # every 10th file removed and every 7th rewritten, then restored
+    from app.backup import CUSTOMS_ROOTS
+    acc_dir = os.path.join(args.workdir, 'acc')
+    store = backup_store(args)
+    for index, (_, path, _) in enumerate(sorted(store.walk(acc_dir, CUSTOMS_ROOTS))):
+        if index % 10 == 0:
+            os.remove(path)
+        elif index % 7 == 0:
+            with open(path, 'r+b') as f:
+                f.write(b'\0' * 16)
+    started = time.perf_counter()
+    plan = store.plan_restore(acc_dir, CUSTOMS_ROOTS)
+    store.apply_restore(acc_dir, plan)
+    elapsed = time.perf_counter() - started
+    return [elapsed], plan['bytes'], len(plan['add']) + len(plan['update'])
+
+
+def scenario_pack(args):
+    from app.ziputil import pack
+    acc_dir = os.path.join(args.workdir, 'acc', 'Customs')
+    out_dir = os.path.join(args.workdir, 'packs')
+    os.makedirs(out_dir, exist_ok=True)
+    latencies = []
+    total = 0
+    for name in sorted(os.listdir(os.path.join(acc_dir, 'Liveries'))):
+        members = [(os.path.join(acc_dir, 'Cars', '{}.json'.format(name)), 'Customs/Cars/{}.json'.format(name))]
+        livery = os.path.join(acc_dir, 'Liveries', name)
+        for member in sorted(os.listdir(livery)):
+            members.append((os.path.join(livery, member), 'Customs/Liveries/{}/{}'.format(name, member)))
+        elapsed, stats = timed(pack, os.path.join(out_dir, '{}.zip'.format(name)), members, None, args.jobs)
+        latencies.append(elapsed)
+        total += stats['bytes_in']
+    return latencies, total, len(latencies)
+
+
+def run_child(args):
+    # stdout carries only the result, the app prints its diagnostics there
+    with redirect_stdout(sys.stderr):
+        setup(args)
+        cpu_started = sum(os.times()[:2])
+        started = time.perf_counter()
+        latencies, size, items = globals()['scenario_{}'.format(args.child)](args)
+        seconds = time.perf_counter() - started
+        cpu = sum(os.times()[:2]) - cpu_started
+    json.dump({
+        'scenario': args.child,
+        'items': items,
+        'seconds': round(seconds, 4),
+        'bytes': size,
+        'throughput_mb_s': round(size / seconds / (1024 * 1024), 2) if size and seconds else None,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50) * 1000, 2),
+            'p90': round(percentile(latencies, 90) * 1000, 2),
+            'p99': round(percentile(latencies, 99) * 1000, 2),
+            'max': round(max(latencies) * 1000, 2),
+        } if latencies else None,
+        'cpu_seconds': round(cpu, 3),
+        'peak_rss_mb': round(peak_rss_mb(), 1) if peak_rss_mb() is not None else None,
+    }, sys.stdout)
+
+
+# orchestrator
+
+def write_config(args, url):
+    with open(os.path.join(args.workdir, 'bench.ini'), 'w', encoding='utf-8') as f:
+        f.write("[generic]\nserver = {}\nworkers = {}\ntransport = {}\n".format(url, args.jobs, args.transport))
+        # sync measures full downloads, the delta scenario turns it on
+        f.write("delta_sync = 0\n")
+        f.write("[ac]\nskins_dir =\n")
+        f.write("[acc]\nskins_dir = {}\n".format(os.path.join(args.workdir, 'acc')))
+        # archive cache off, extract works on the spooled downloads
+        f.write("[cache]\narchive_cache_mb = 0\n")
+        f.write("[backup]\ndestination_path = {}\n".format(os.path.join(args.workdir, 'backup')))
+    for path in (('acc', 'Customs', 'Cars'), ('acc', 'Customs', 'Liveries'), ('home',)):
+        os.makedirs(os.path.join(args.workdir, *path), exist_ok=True)
+
+
+def previous_record(path, params):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    except (OSError, ValueError):
+        return None
+    for record in reversed(records):
+        if record.get('params') == params:
+            return record
+    return None
+
+
+def change(new, old):
+    if new is None or not old:
+        return ""
+    return "{:+.1f}%".format((new - old) * 100.0 / old)
+
+
+def report(results, previous):
+    before = {result['scenario']: result for result in (previous or {}).get('results', [])}
+    print("{:<20} {:>7} {:>9} {:>10} {:>9} {:>9} {:>9} {:>8} {:>8} {:>9} {:>9}".format(
+        "scenario", "items", "seconds", "MB/s", "p50 ms", "p90 ms", "p99 ms", "cpu s", "rss MB", "d MB/s", "d p50"))
+    for result in results:
+        latency = result['latency_ms'] or {}
+        old = before.get(result['scenario'], {})
+        old_latency = old.get('latency_ms') or {}
+        print("{:<20} {:>7} {:>9} {:>10} {:>9} {:>9} {:>9} {:>8} {:>8} {:>9} {:>9}".format(
+            result['scenario'], result['items'], result['seconds'], result['throughput_mb_s'] or '-',
+            latency.get('p50', '-'), latency.get('p90', '-'), latency.get('p99', '-'),
+            result['cpu_seconds'], result['peak_rss_mb'] or '-',
+            change(result['throughput_mb_s'], old.get('throughput_mb_s')),
+            change(latency.get('p50'), old_latency.get('p50')),
+        ))
+
+
+def run(args, argv):
+    from benchmarks.synthetic import Payloads, manifest, skin_name
+    from benchmarks.server import SkinServer
+
+    payloads = Payloads(int(args.member_mb * 1024 * 1024))
+    sums = {skin_name(index): payloads.checksum(skin_name(index)) for index in range(min(args.downloads, args.skins))}
+    server = SkinServer(manifest(args.skins, sums=sums), payloads, latency=args.latency_ms / 1000.0)
+    server.start()
+
+    keep = args.workdir is not None
+    args.workdir = args.workdir or tempfile.mkdtemp(prefix='scm-bench-')
+    write_config(args, server.url)
+    results = []
+    try:
+        for scenario in args.scenario or SCENARIOS:
+            print("running {}...".format(scenario), file=sys.stderr)
+            proc = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.run'] + argv + ['--child', scenario, '--workdir', args.workdir],
+                cwd=ROOT, stdout=subprocess.PIPE, check=True
+            )
+            results.append(json.loads(proc.stdout))
+    finally:
+        server.shutdown()
+        if not keep:
+            shutil.rmtree(args.workdir, ignore_errors=True)
+
+    params = {name: getattr(args, name) for name in PARAMS}
+    previous = previous_record(args.output, params)
+    report(results, previous)
+    record = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': params,
+        'results': results,
+    }
+    with open(args.output, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run")
+    parser.add_argument("--skins", type=int, default=100, help="skins in the synthetic manifest (10 - 10000)")
+    parser.add_argument("--downloads", type=int, default=20, help="skins downloaded, extracted, backed up and packed")
+    parser.add_argument("--member-mb", type=float, default=4, help="size of the largest DDS member")
+    parser.add_argument("--jobs", type=int, default=3, help="download workers (generic/workers)")
+    parser.add_argument("--transport", choices=('threads', 'asyncio'), default='threads')
+    parser.add_argument("--latency-ms", type=float, default=0, help="artificial server latency per request")
+    parser.add_argument("--repeat", type=int, default=20, help="repetitions of the manifest scenarios")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="run only these, in order")
+    parser.add_argument("--workdir", help="keep the generated files here instead of a temp directory")
+    parser.add_argument("--output", default=os.path.join(ROOT, 'benchmarks', 'results.jsonl'))
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(args)
+    else:
+        run(args, argv)
+
+
+if __name__ == '__main__':
+    main()
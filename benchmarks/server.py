@@ -0,0 +1,96 @@
+import json
+import time
+import hashlib
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# stand-in for the skin server: /api/skins/list with ETag validation and
+# /api/skins/{league}/{car}/{skin}/download with Range/If-Range support, optionally
+# with an artificial per-request latency
+class SkinServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, skins, payloads, latency=0.0, address=('127.0.0.1', 0)):
+        super(SkinServer, self).__init__(address, SkinRequestHandler)
+        self.payloads = payloads
+        self.latency = latency
+        self.set_manifest(skins)
+
+    def set_manifest(self, skins):
+        self.manifest = json.dumps(skins).encode('utf-8')
+        self.etag = '"{}"'.format(hashlib.md5(self.manifest).hexdigest())
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class SkinRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        parts = self.path.strip('/').split('/')
+        if self.path == '/api/skins/list':
+            self.send_manifest()
+        elif len(parts) == 6 and parts[:2] == ['api', 'skins'] and parts[5] == 'download':
+            self.send_payload(self.server.payloads.get(parts[4]))
+        else:
+            self.send_body(200, b'ok')
+
+    def send_body(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_manifest(self):
+        if self.headers.get('If-None-Match') == self.server.etag:
+            self.send_response(304)
+            self.send_header('ETag', self.server.etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_body(200, self.server.manifest, {'ETag': self.server.etag, 'Content-Type': 'application/json'})
+
+    def send_payload(self, data):
+        etag = '"{}"'.format(hashlib.md5(data).hexdigest())
+        value = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if not value or (if_range and if_range != etag):
+            self.send_body(200, data, {'ETag': etag})
+            return
+        try:
+            first, last = value.split('=', 1)[1].split('-', 1)
+            if first:
+                start, end = int(first), int(last) if last else len(data) - 1
+            else:
+                # suffix range, the last n bytes
+                start, end = max(len(data) - int(last), 0), len(data) - 1
+        except (IndexError, ValueError):
+            self.send_body(200, data, {'ETag': etag})
+            return
+        if start >= len(data):
+            self.send_body(416, b'', {'Content-Range': 'bytes */{}'.format(len(data))})
+            return
+        end = min(end, len(data) - 1)
+        self.send_body(206, data[start:end + 1], {
+            'ETag': etag,
+            'Content-Range': 'bytes {}-{}/{}'.format(start, end, len(data)),
+        })
@@ -0,0 +1,98 @@
+import io
+import random
+import hashlib
+import threading
+
+from zipfile import ZipFile, ZipInfo, ZIP_STORED, ZIP_DEFLATED
+
+
+# DXT blocks are 8/16 bytes, real liveries mix noisy areas with flat colour,
+# so a quarter of the generated blocks repeat and deflate saves a little
+_BLOCK_SIZE = 16
+_REPEAT_RATIO = 0.25
+
+LEAGUE_COLORS = ('#ff5656', '#00cc00', '#3399ff', '#ffaa00', '#cc66ff')
+
+
+def dds_bytes(size, seed):
+    rnd = random.Random(seed)
+    flat = bytes(rnd.getrandbits(8) for _ in range(_BLOCK_SIZE))
+    noise = rnd.randbytes(size)
+    out = bytearray(noise)
+    step = int(1 / _REPEAT_RATIO) * _BLOCK_SIZE
+    for offset in range(0, size - _BLOCK_SIZE, step):
+        out[offset:offset + _BLOCK_SIZE] = flat
+    return bytes(out)
+
+
+def skin_name(index, car='gt3'):
+    # "<number>-<car>-<id>", the app takes the car folder from the second field
+    return "{}-{}-bench{}".format(index, car, index)
+
+
+def manifest(count, leagues=5, game_id=1, timestamp=1700000000, sums=None):
+    # same fields as /api/skins/list, sums maps skin names to archive checksums
+    sums = sums or {}
+    skins = []
+    for index in range(count):
+        league = index % leagues + 1
+        name = skin_name(index)
+        skins.append({
+            'game_id': game_id,
+            'league_id': league,
+            'league_name': "Bench league {}".format(league),
+            'league_color_rgb': LEAGUE_COLORS[league % len(LEAGUE_COLORS)],
+            'league_type': 'single',
+            'skin_name': "{}.zip".format(name),
+            'sum': sums.get(name),
+            'timestamp': timestamp,
+            'car_name': 'Bench GT3',
+            'car_class': 'GT3',
+            'car_year': 2023,
+            'number': index,
+            'driver_name': "Driver {}".format(index),
+            'team_name': "Team {}".format(index % 20),
+        })
+    return skins
+
+
+class Payloads:
+    # zip archives laid out like the ones the server hands out: the car json
+    # plus a livery folder with a few DDS members, built once per skin
+
+    _MEMBERS = (('decals.dds', 1.0), ('sponsors.dds', 0.5), ('decals_1.dds', 0.25))
+
+    def __init__(self, member_size):
+        self.member_size = member_size
+        self.lock = threading.Lock()
+        self.cache = {}
+        self.textures = {}
+
+    def texture(self, name, size):
+        # textures are shared between skins, only the names differ
+        key = (name, size)
+        if key not in self.textures:
+            self.textures[key] = dds_bytes(size, name)
+        return self.textures[key]
+
+    def build(self, name):
+        buffer = io.BytesIO()
+        with ZipFile(buffer, 'w') as zf:
+            zf.writestr(ZipInfo('Customs/Cars/{}.json'.format(name)),
+                        '{{"customSkinName": "{}"}}'.format(name).encode('utf-16'), ZIP_DEFLATED)
+            for member, scale in self._MEMBERS:
+                data = self.texture(member, max(int(self.member_size * scale), 1024))
+                zf.writestr(ZipInfo('Customs/Liveries/{}/{}'.format(name, member)), data, ZIP_STORED)
+        return buffer.getvalue()
+
+    def get(self, name):
+        with self.lock:
+            data = self.cache.get(name)
+        if data is None:
+            data = self.build(name)
+            with self.lock:
+                self.cache[name] = data
+        return data
+
+    def checksum(self, name):
+        return hashlib.md5(self.get(name)).hexdigest()